@@ -40,6 +40,9 @@ class Settings(BaseSettings):
     # HuggingFace Model (remote API fallback)
     HF_MODEL: str = "Qwen/Qwen2.5-VL-72B-Instruct"
     
+    # Max concurrent requests for batch health-data extraction
+    AI_BATCH_CONCURRENCY: int = 8
+    
     # Google API (Legacy - kept for backward compatibility)
     GOOGLE_API_KEY: str = ""
     
@@ -88,6 +91,21 @@ class Settings(BaseSettings):
         "image/webp",
     ]
     
+    # ===================
+    # OCR
+    # ===================
+    OCR_CONCURRENCY: int = 8  # Max scanned PDF pages sent to the vision model at once
+    # Try local Tesseract on scanned PDF pages first; only pages it reads
+    # poorly are escalated to the vision model
+    OCR_TESSERACT_ENABLED: bool = True
+    OCR_TESSERACT_MIN_CONFIDENCE: float = 75.0  # Mean word confidence, 0-100
+    OCR_TESSERACT_MIN_WORDS: int = 20
+    OCR_MAX_PAGES: int = 50  # Scanned PDF pages OCR'd per document
+    OCR_BATCH_SIZE: int = 4  # Scanned pages per vision model request
+    # Cap on vision decode tokens reserved per document; pages past the
+    # point where it runs out are left out and the result marked truncated
+    OCR_MAX_TOKEN_BUDGET: int = 100_000
+    
     # ===================
     # Rate Limiting
     # ===================
@@ -53,6 +53,16 @@ class ValidationError(CareBridgeException):
         )
 
 
+class ConflictError(CareBridgeException):
+    """Request conflicts with the current state of a resource."""
+    
+    def __init__(self, detail: str = "Conflict"):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=detail,
+        )
+
+
 class RateLimitError(CareBridgeException):
     """Rate limit exceeded."""
     
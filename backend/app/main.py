@@ -27,7 +27,9 @@ from app.core.exceptions import (
 )
 from app.middleware.security import SecurityHeadersMiddleware, RateLimitMiddleware
 from app.routes import router as api_router
+from app.services.ai import ai_service
 from app.services.firebase import initialize_firebase
+from app.services.ocr import ocr_service
 
 # ===================
 # Logging Setup
@@ -116,6 +118,8 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("CareBridge Backend shutting down...")
+    await ai_service.aclose()
+    await ocr_service.aclose()
 
 
 # ===================
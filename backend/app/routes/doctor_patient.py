@@ -8,8 +8,8 @@ from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
 
 from app.core.auth import get_current_user
-from app.services.firebase import get_db
-from app.services.storage import get_download_url
+from app.services.firebase import get_db, doctor_patient_link_id, get_doctor_patient_link
+from app.services.storage import get_download_url_async
 
 logger = logging.getLogger(__name__)
 
@@ -172,16 +172,14 @@ async def request_appointment(
         raise HTTPException(status_code=400, detail="Cannot request appointment with yourself")
 
     # Check existing active/pending link
-    existing = db.collection("doctor_patients") \
-        .where("doctor_id", "==", doctor_id) \
-        .where("patient_id", "==", patient_id) \
-        .where("status", "in", ["active", "pending_appointment"]) \
-        .stream()
-    if any(True for _ in existing):
+    existing = get_doctor_patient_link(
+        db, doctor_id, patient_id, statuses=("active", "pending_appointment"),
+    )
+    if existing:
         raise HTTPException(status_code=400, detail="You already have a pending or active connection with this doctor")
 
-    # Create pending appointment request
-    link_id = str(uuid4())
+    # Create pending appointment request (keyed by doctor/patient pair)
+    link_id = doctor_patient_link_id(doctor_id, patient_id)
     vd = doctor_data.get("verification_data", {})
     link_data = {
         "id": link_id,
@@ -198,7 +196,15 @@ async def request_appointment(
         "document_access": "none",
         "created_at": datetime.utcnow().isoformat(),
     }
-    db.collection("doctor_patients").document(link_id).set(link_data)
+    link_ref = db.collection("doctor_patients").document(link_id)
+    previous = link_ref.get()
+    batch = db.batch()
+    if previous.exists:
+        # The pair had a rejected or removed link under this ID: archive it
+        # rather than overwrite its history and timestamps
+        batch.set(link_ref.collection("history").document(str(uuid4())), previous.to_dict())
+    batch.set(link_ref, link_data)
+    batch.commit()
     logger.info(f"Patient {patient_id} sent appointment request to doctor {doctor_id}")
 
     return {"message": "Appointment request sent to doctor. Awaiting acceptance.", "link_id": link_id, "status": "pending_appointment"}
@@ -371,16 +377,7 @@ async def get_patient_documents(
     db = get_db()
 
     # Verify active link WITH granted document access
-    links = db.collection("doctor_patients") \
-        .where("doctor_id", "==", doctor_id) \
-        .where("patient_id", "==", patient_id) \
-        .where("status", "==", "active") \
-        .stream()
-
-    link_found = None
-    for l in links:
-        link_found = l.to_dict()
-        break
+    link_found = get_doctor_patient_link(db, doctor_id, patient_id)
 
     if not link_found:
         raise HTTPException(status_code=403, detail="This patient is not in your care list")
@@ -400,7 +397,7 @@ async def get_patient_documents(
         storage_path = dd.get("storage_path")
         if storage_path:
             try:
-                download_url = get_download_url(storage_path, expiration_minutes=60)
+                download_url = await get_download_url_async(storage_path, expiration_minutes=60)
             except Exception:
                 pass
         documents.append({
@@ -429,16 +426,7 @@ async def get_patient_document_detail(
     await verify_doctor(doctor_id)
     db = get_db()
 
-    links = db.collection("doctor_patients") \
-        .where("doctor_id", "==", doctor_id) \
-        .where("patient_id", "==", patient_id) \
-        .where("status", "==", "active") \
-        .stream()
-
-    link_found = None
-    for l in links:
-        link_found = l.to_dict()
-        break
+    link_found = get_doctor_patient_link(db, doctor_id, patient_id)
 
     if not link_found:
         raise HTTPException(status_code=403, detail="This patient is not in your care list")
@@ -457,7 +445,7 @@ async def get_patient_document_detail(
     storage_path = dd.get("storage_path")
     if storage_path:
         try:
-            download_url = get_download_url(storage_path, expiration_minutes=60)
+            download_url = await get_download_url_async(storage_path, expiration_minutes=60)
         except Exception:
             pass
 
@@ -626,12 +614,7 @@ async def request_consultation(
     doctor_data = doctor_doc.to_dict()
 
     # Verify doctor-patient relationship exists (active)
-    links = db.collection("doctor_patients") \
-        .where("doctor_id", "==", request.doctor_id) \
-        .where("patient_id", "==", patient_id) \
-        .where("status", "==", "active") \
-        .stream()
-    if not any(True for _ in links):
+    if not get_doctor_patient_link(db, request.doctor_id, patient_id):
         raise HTTPException(status_code=403, detail="You must have an active appointment with this doctor first.")
 
     # Verify documents belong to the patient
@@ -787,7 +770,7 @@ async def get_consultation(
                 storage_path = dd.get("storage_path")
                 if storage_path:
                     try:
-                        download_url = get_download_url(storage_path, expiration_minutes=60)
+                        download_url = await get_download_url_async(storage_path, expiration_minutes=60)
                     except Exception:
                         pass
                 documents.append({
@@ -2,31 +2,43 @@
 import asyncio
 import hashlib
 import logging
-from datetime import datetime, timezone
+import tempfile
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Optional, Dict, Any
 from uuid import uuid4
 
+import blake3
 from fastapi import (
     APIRouter, Depends, File, HTTPException, Query, 
     UploadFile, status,
 )
-from fastapi.responses import Response, FileResponse
+from fastapi.responses import Response, FileResponse, StreamingResponse
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
 from app.config import settings
 from app.core.auth import get_current_user
-from app.core.exceptions import NotFoundError, ValidationError
-from app.services.firebase import get_db
-from app.services.storage import upload_to_storage, get_download_url, download_from_storage, delete_from_storage, LOCAL_STORAGE_DIR
+from app.core.exceptions import ConflictError, NotFoundError, ValidationError
+from app.services.firebase import get_db, get_doctor_patient_link, fs_get, fs_run, fs_stream
+from app.services.storage import (
+    upload_to_storage_async, get_download_url_async, download_to_file_async, LOCAL_STORAGE_DIR,
+    signed_url_min_minutes,
+)
 from app.services.ocr import ocr_service
 from app.services.ai import ai_service
 from app.services.analysis import analysis_service
+from app.services.health_trends import rebuild_buckets
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["Documents"])
 
+# Upload limits, resolved once at import
+_ALLOWED_MIME_TYPES = frozenset(settings.ALLOWED_MIME_TYPES)
+_MAX_FILE_SIZE_BYTES = settings.MAX_FILE_SIZE_MB << 20
+
 
 class DocumentResponse(BaseModel):
     """Document response model."""
@@ -54,13 +66,150 @@ class DocumentListResponse(BaseModel):
     per_page: int
 
 
+# Fields fetched for document listings (skips the full ocr_text payload)
+_LIST_FIELDS = [
+    "id", "filename", "document_type", "mime_type", "file_size",
+    "ocr_preview", "ocr_confidence", "content_hash",
+    "blockchain_tx_hash", "blockchain_block_number", "blockchain_anchored_at",
+    "status", "created_at", "updated_at",
+]
+
+OCR_PREVIEW_CHARS = 200
+
+
+# OCR text returned in upload responses
+OCR_UPLOAD_RESPONSE_CHARS = 1000
+
+
+def make_upload_ocr_text(text: str) -> str:
+    """Truncate OCR text to what the upload endpoint returns."""
+    if len(text) >= OCR_UPLOAD_RESPONSE_CHARS:
+        return text[:OCR_UPLOAD_RESPONSE_CHARS] + "..."
+    return text
+
+
+def make_ocr_preview(text: str) -> str:
+    """Truncate OCR text to the preview shown in document listings."""
+    if len(text) > OCR_PREVIEW_CHARS:
+        return text[:OCR_PREVIEW_CHARS] + "..."
+    return text
+
+
+# Stored files are spooled through memory up to this size, then to disk
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
 def compute_hash(data: bytes) -> str:
     """Compute SHA-256 hash of data."""
     return hashlib.sha256(data).hexdigest()
 
 
+def compute_content_key(data: bytes) -> str:
+    """
+    Compute BLAKE3 hash of data for duplicate-upload detection.
+
+    Not used for integrity — blockchain anchoring keeps the SHA-256
+    `content_hash`.
+    """
+    return blake3.blake3(data).hexdigest()
+
+
+async def _find_duplicate_upload(db, user_id: str, content_key: str) -> Optional[Dict[str, Any]]:
+    """Return the user's existing non-deleted document with this content key."""
+    matches = await fs_stream(
+        db.collection("documents")
+        .where("user_id", "==", user_id)
+        .where("content_key", "==", content_key)
+    )
+    for doc in matches:
+        doc_data = doc.to_dict()
+        if doc_data.get("status") != "deleted":
+            return doc_data
+    return None
+
+
+# Per-user content-key claims, created atomically so concurrent uploads of
+# the same file produce one document
+UPLOAD_KEYS_COLLECTION = "upload_keys"
+# A claim whose document never appeared (crashed upload) is taken over after this
+UPLOAD_CLAIM_STALE_AFTER = timedelta(minutes=10)
+
+
+def _upload_key_ref(db, user_id: str, content_key: str):
+    """Deterministic claim document for one user's file content."""
+    return db.collection(UPLOAD_KEYS_COLLECTION).document(f"{user_id}_{content_key}")
+
+
+async def _claim_upload(
+    db, user_id: str, content_key: str, doc_id: str,
+) -> Optional[Dict[str, Any]]:
+    """
+    Claim this file's content key for a new document `doc_id`.
+
+    Returns None if the claim was taken, or the existing document if
+    another upload of the same file already created it. Raises
+    ConflictError while that upload is still being processed.
+    """
+    ref = _upload_key_ref(db, user_id, content_key)
+    now = datetime.now(timezone.utc)
+    claim = {"user_id": user_id, "document_id": doc_id, "created_at": now.isoformat()}
+    try:
+        await fs_run(ref.create, claim)
+        return None
+    except AlreadyExists:
+        pass
+
+    held = await fs_get(ref)
+    held_data = held.to_dict() or {}
+    held_doc_id = held_data.get("document_id")
+    if held_doc_id:
+        doc = await fs_get(db.collection("documents").document(held_doc_id))
+        if doc.exists:
+            doc_data = doc.to_dict()
+            if doc_data.get("status") != "deleted":
+                return doc_data
+        elif held_data.get("created_at", "") > (now - UPLOAD_CLAIM_STALE_AFTER).isoformat():
+            raise ConflictError("An identical upload is already being processed")
+
+    # The claimed document was deleted or never written: take the claim over,
+    # unless another upload got there first
+    try:
+        await fs_run(
+            ref.update, claim,
+            option=db.write_option(last_update_time=held.update_time),
+        )
+    except FailedPrecondition:
+        raise ConflictError("An identical upload is already being processed")
+    return None
+
+
+async def _get_owned_document(db, document_id: str, user_id: str):
+    """
+    Fetch a non-deleted document owned by `user_id`.
+
+    Ownership and soft-delete filters run in the Firestore query, so
+    documents belonging to other users are never transferred.
+
+    Returns:
+        Tuple of (document reference, document data)
+    """
+    doc_ref = db.collection("documents").document(document_id)
+    matches = await fs_stream(
+        db.collection("documents")
+        .where("__name__", "==", doc_ref)
+        .where("user_id", "==", user_id)
+        .where("status", "!=", "deleted")
+        .limit(1)
+    )
+    if not matches:
+        raise NotFoundError("Document")
+    return doc_ref, matches[0].to_dict()
+
+
 @router.post("", status_code=status.HTTP_201_CREATED, response_model=DocumentResponse)
 async def upload_document(
+    response: Response,
     file: UploadFile = File(...),
     document_type: Optional[str] = Query(None, description="Document type (lab_report, prescription, imaging, other)"),
     current_user: Dict[str, Any] = Depends(get_current_user),
@@ -72,29 +221,75 @@ async def upload_document(
     
     - **file**: The document file to upload
     - **document_type**: Optional classification (lab_report, prescription, imaging, other)
+    
+    Re-uploading a file the user already has returns the existing document
+    with 200 instead of creating a new one (its stored filename is kept);
+    a `document_type` that differs from the existing one is rejected with
+    409, as is a second upload of a file that is still being processed.
     """
     # Validate file type
-    if file.content_type not in settings.ALLOWED_MIME_TYPES:
+    if file.content_type not in _ALLOWED_MIME_TYPES:
         raise ValidationError(
             f"Unsupported file type: {file.content_type}. "
             f"Allowed: {', '.join(settings.ALLOWED_MIME_TYPES)}"
         )
     
+    # Reject oversized uploads before reading them when the size is known
+    if file.size is not None and file.size > _MAX_FILE_SIZE_BYTES:
+        raise ValidationError(
+            f"File too large ({file.size / 1024 / 1024:.1f}MB). "
+            f"Maximum: {settings.MAX_FILE_SIZE_MB}MB"
+        )
+    
     # Read file data
     file_data = await file.read()
     file_size = len(file_data)
     
     # Check file size
-    max_size_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024
-    if file_size > max_size_bytes:
+    if file_size > _MAX_FILE_SIZE_BYTES:
         raise ValidationError(
             f"File too large ({file_size / 1024 / 1024:.1f}MB). "
             f"Maximum: {settings.MAX_FILE_SIZE_MB}MB"
         )
     
-    # Generate document ID and compute hash
+    db = get_db()
+    
+    # Skip re-processing if this exact file was already uploaded. The query
+    # finds documents stored before upload claims existed; the claim makes
+    # concurrent uploads of the same file resolve to a single document.
+    content_key = await asyncio.to_thread(compute_content_key, file_data)
     doc_id = str(uuid4())
-    content_hash = compute_hash(file_data)
+    existing = await _find_duplicate_upload(db, current_user["id"], content_key)
+    if not existing:
+        existing = await _claim_upload(db, current_user["id"], content_key, doc_id)
+    if existing:
+        existing_type = existing.get("document_type", "other")
+        if document_type and document_type != existing_type:
+            raise ConflictError(
+                f"This file was already uploaded as document {existing['id']} "
+                f"with type '{existing_type}'"
+            )
+        logger.info(
+            f"Duplicate upload of document {existing['id']} "
+            f"(filename={file.filename!r}), returning existing document"
+        )
+        response.status_code = status.HTTP_200_OK
+        return DocumentResponse(
+            id=existing["id"],
+            filename=existing["filename"],
+            document_type=existing_type,
+            mime_type=existing["mime_type"],
+            file_size=existing["file_size"],
+            ocr_text=make_upload_ocr_text(existing.get("ocr_text") or ""),
+            ocr_confidence=existing.get("ocr_confidence"),
+            content_hash=existing.get("content_hash"),
+            blockchain_tx_hash=existing.get("blockchain_tx_hash"),
+            blockchain_block_number=existing.get("blockchain_block_number"),
+            blockchain_anchored_at=existing.get("blockchain_anchored_at"),
+            status=existing.get("status", "ready"),
+            created_at=existing["created_at"],
+            updated_at=existing.get("updated_at", existing["created_at"]),
+        )
     
     # Determine effective document type
     effective_type = document_type or "other"
@@ -103,19 +298,27 @@ async def upload_document(
     SCAN_TYPES = ("imaging", "radiology", "xray", "ct_scan", "mri")
     is_scan = effective_type in SCAN_TYPES or file.content_type.startswith("image/")
     
-    # Extract text using MediX vision (images) or PyPDF2 (PDFs)
-    logger.info(f"Starting OCR for document {doc_id} (MediX)")
-    ocr_result = await ocr_service.extract_text(file_data, file.content_type)
-    
-    # Store file in Firebase Cloud Storage
     safe_filename = file.filename.replace("/", "_").replace("\\", "_")
     cloud_path = f"documents/{current_user['id']}/{doc_id}_{safe_filename}"
-    storage_uri = upload_to_storage(file_data, cloud_path, file.content_type)
+    
+    # Hash (CPU), OCR via MediX vision / PyPDF2 (model server) and the
+    # Firebase Cloud Storage upload (network) are independent — overlap them
+    logger.info(f"Starting OCR for document {doc_id} (MediX)")
+    try:
+        content_hash, ocr_result, storage_uri = await asyncio.gather(
+            asyncio.to_thread(compute_hash, file_data),
+            ocr_service.extract_text(file_data, file.content_type, content_key),
+            upload_to_storage_async(file_data, cloud_path, file.content_type),
+        )
+    except Exception:
+        # Let a retry of the same file through straight away
+        await fs_run(_upload_key_ref(db, current_user["id"], content_key).delete)
+        raise
     
     logger.info(f"Saved file to {storage_uri}")
     
     # Prepare document data
-    now = datetime.utcnow().isoformat()
+    now = datetime.now(timezone.utc).isoformat()
     doc_data = {
         "id": doc_id,
         "user_id": current_user["id"],
@@ -124,8 +327,10 @@ async def upload_document(
         "mime_type": file.content_type,
         "file_size": file_size,
         "content_hash": content_hash,
+        "content_key": content_key,
         "storage_path": cloud_path,
         "ocr_text": ocr_result.text[:15000] if ocr_result.text else "",  # Limit stored text
+        "ocr_preview": make_ocr_preview(ocr_result.text or ""),
         "ocr_confidence": ocr_result.confidence,
         "ocr_method": ocr_result.method,
         "is_scan": is_scan,
@@ -136,8 +341,7 @@ async def upload_document(
     }
     
     # Save to Firestore
-    db = get_db()
-    db.collection("documents").document(doc_id).set(doc_data)
+    await fs_run(db.collection("documents").document(doc_id).set, doc_data)
     
     # Trigger background AI analysis
     asyncio.create_task(
@@ -156,7 +360,7 @@ async def upload_document(
         document_type=doc_data["document_type"],
         mime_type=file.content_type,
         file_size=file_size,
-        ocr_text=doc_data["ocr_text"] if len(doc_data["ocr_text"]) < 1000 else doc_data["ocr_text"][:1000] + "...",
+        ocr_text=make_upload_ocr_text(doc_data["ocr_text"]),
         ocr_confidence=ocr_result.confidence,
         content_hash=content_hash,
         status="ready",
@@ -188,9 +392,12 @@ async def list_documents(
     if document_type:
         query = query.where("document_type", "==", document_type)
     
+    # Only fetch listing fields, not the full OCR text
+    query = query.select(_LIST_FIELDS)
+    
     # Get all matching documents
     all_docs = []
-    for doc in query.stream():
+    for doc in await fs_stream(query):
         doc_data = doc.to_dict()
         if doc_data.get("status") != "deleted":
             all_docs.append(doc_data)
@@ -204,20 +411,42 @@ async def list_documents(
     end = start + per_page
     page_docs = all_docs[start:end]
     
-    # Convert to response model
+    # Documents uploaded before ocr_preview existed: fetch their full text
+    # once, and store the preview so later listings stay on the masked path
+    legacy = [d for d in page_docs if "ocr_preview" not in d]
+    if legacy:
+        refs = [db.collection("documents").document(d["id"]) for d in legacy]
+        ocr_docs = await fs_run(
+            lambda: list(db.get_all(refs, field_paths=["ocr_text"]))
+        )
+        previews = {
+            ocr_doc.id: make_ocr_preview((ocr_doc.to_dict() or {}).get("ocr_text") or "")
+            for ocr_doc in ocr_docs
+            if ocr_doc.exists
+        }
+
+        def backfill():
+            batch = db.batch()
+            for doc_id, preview in previews.items():
+                batch.update(db.collection("documents").document(doc_id), {"ocr_preview": preview})
+            batch.commit()
+
+        if previews:
+            await fs_run(backfill)
+        for d in legacy:
+            d["ocr_preview"] = previews.get(d["id"], "")
+    
+    # Convert to response model (stored rows were validated at write time,
+    # so skip per-field validation)
     documents = []
     for d in page_docs:
-        ocr_preview = d.get("ocr_text", "")
-        if ocr_preview and len(ocr_preview) > 200:
-            ocr_preview = ocr_preview[:200] + "..."
-        
-        documents.append(DocumentResponse(
+        documents.append(DocumentResponse.model_construct(
             id=d["id"],
             filename=d["filename"],
             document_type=d.get("document_type", "other"),
             mime_type=d["mime_type"],
             file_size=d["file_size"],
-            ocr_text=ocr_preview,
+            ocr_text=d.get("ocr_preview", ""),
             ocr_confidence=d.get("ocr_confidence"),
             content_hash=d.get("content_hash"),
             blockchain_tx_hash=d.get("blockchain_tx_hash"),
@@ -243,20 +472,7 @@ async def get_document(
 ):
     """Get document details including full OCR text."""
     db = get_db()
-    doc_ref = db.collection("documents").document(document_id)
-    doc = doc_ref.get()
-    
-    if not doc.exists:
-        raise NotFoundError("Document")
-    
-    doc_data = doc.to_dict()
-    
-    # Authorization check
-    if doc_data.get("user_id") != current_user["id"]:
-        raise NotFoundError("Document")
-    
-    if doc_data.get("status") == "deleted":
-        raise NotFoundError("Document")
+    _, doc_data = await _get_owned_document(db, document_id, current_user["id"])
     
     return DocumentResponse(
         id=doc_data["id"],
@@ -283,16 +499,7 @@ async def get_document_text(
 ):
     """Get full OCR text for a document."""
     db = get_db()
-    doc_ref = db.collection("documents").document(document_id)
-    doc = doc_ref.get()
-    
-    if not doc.exists:
-        raise NotFoundError("Document")
-    
-    doc_data = doc.to_dict()
-    
-    if doc_data.get("user_id") != current_user["id"]:
-        raise NotFoundError("Document")
+    _, doc_data = await _get_owned_document(db, document_id, current_user["id"])
     
     return {
         "document_id": document_id,
@@ -310,16 +517,7 @@ async def download_document(
 ):
     """Download the original document file."""
     db = get_db()
-    doc_ref = db.collection("documents").document(document_id)
-    doc = doc_ref.get()
-    
-    if not doc.exists:
-        raise NotFoundError("Document")
-    
-    doc_data = doc.to_dict()
-    
-    if doc_data.get("user_id") != current_user["id"]:
-        raise NotFoundError("Document")
+    _, doc_data = await _get_owned_document(db, document_id, current_user["id"])
     
     storage_path = doc_data.get("storage_path")
     if not storage_path:
@@ -328,20 +526,26 @@ async def download_document(
             detail="File not available for download"
         )
     
-    # Download from Firebase Storage and serve
-    file_bytes = download_from_storage(storage_path)
-    if file_bytes is None:
+    # Download from Firebase Storage and stream it back; the spool only
+    # stays in memory for small files and rolls over to disk otherwise
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    if not await download_to_file_async(storage_path, spool):
+        spool.close()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found in cloud storage"
         )
+    size = spool.tell()
+    spool.seek(0)
     
-    return Response(
-        content=file_bytes,
+    return StreamingResponse(
+        iter(lambda: spool.read(STREAM_CHUNK_SIZE), b""),
         media_type=doc_data["mime_type"],
         headers={
-            "Content-Disposition": f'attachment; filename="{doc_data["filename"]}"'
+            "Content-Disposition": f'attachment; filename="{doc_data["filename"]}"',
+            "Content-Length": str(size),
         },
+        background=BackgroundTask(spool.close),
     )
 
 
@@ -353,7 +557,7 @@ async def get_document_url(
     """Get a signed download/preview URL for the document. Works for both owner and linked doctors."""
     db = get_db()
     doc_ref = db.collection("documents").document(document_id)
-    doc = doc_ref.get()
+    doc = await fs_get(doc_ref)
     
     if not doc.exists:
         raise NotFoundError("Document")
@@ -366,12 +570,8 @@ async def get_document_url(
     is_linked_doctor = False
     if not is_owner:
         # Check if user is a doctor linked to the document owner
-        links = db.collection("doctor_patients") \
-            .where("doctor_id", "==", user_id) \
-            .where("patient_id", "==", doc_data.get("user_id")) \
-            .where("status", "==", "active") \
-            .stream()
-        is_linked_doctor = any(True for _ in links)
+        link = await fs_run(get_doctor_patient_link, db, user_id, doc_data.get("user_id"))
+        is_linked_doctor = link is not None
     
     if not is_owner and not is_linked_doctor:
         raise NotFoundError("Document")
@@ -383,13 +583,14 @@ async def get_document_url(
             detail="File not available"
         )
     
-    url = get_download_url(storage_path, expiration_minutes=60)
+    url = await get_download_url_async(storage_path, expiration_minutes=60)
     return {
         "document_id": document_id,
         "filename": doc_data["filename"],
         "mime_type": doc_data["mime_type"],
         "download_url": url,
-        "expires_in_minutes": 60,
+        # Signed URLs may be served from cache; report the guaranteed minimum
+        "expires_in_minutes": signed_url_min_minutes(60),
     }
 
 
@@ -441,23 +642,20 @@ async def delete_document(
 ):
     """Soft delete a document (marks as deleted)."""
     db = get_db()
-    doc_ref = db.collection("documents").document(document_id)
-    doc = doc_ref.get()
-    
-    if not doc.exists:
-        raise NotFoundError("Document")
-    
-    doc_data = doc.to_dict()
-    
-    if doc_data.get("user_id") != current_user["id"]:
-        raise NotFoundError("Document")
+    doc_ref, doc_data = await _get_owned_document(db, document_id, current_user["id"])
     
     # Soft delete
-    doc_ref.update({
+    await fs_run(doc_ref.update, {
         "status": "deleted",
-        "updated_at": datetime.utcnow().isoformat(),
+        "updated_at": datetime.now(timezone.utc).isoformat(),
     })
     
+    # The shared OCR cache holds this file's text; don't keep it around,
+    # and release the upload claim so the file can be uploaded again
+    if doc_data.get("content_key"):
+        await ocr_service.evict_cached(doc_data["content_key"])
+        await fs_run(_upload_key_ref(db, current_user["id"], doc_data["content_key"]).delete)
+    
     # Cascade: delete associated health records
     hr_query = (
         db.collection("health_records")
@@ -465,10 +663,14 @@ async def delete_document(
         .where("document_id", "==", document_id)
     )
     deleted_hr = 0
-    for hr_doc in hr_query.stream():
-        db.collection("health_records").document(hr_doc.id).delete()
+    for hr_doc in await fs_stream(hr_query):
+        await fs_run(db.collection("health_records").document(hr_doc.id).delete)
         deleted_hr += 1
     
+    # Trend buckets can't un-apply min/max, so recompute them
+    if deleted_hr:
+        await fs_run(rebuild_buckets, db, current_user["id"])
+    
     logger.info(
         f"Document deleted: {document_id}, "
         f"cascade-deleted {deleted_hr} health records"
@@ -488,16 +690,7 @@ async def analyze_document(
     Uses AI to extract lab values, medications, and other health data.
     """
     db = get_db()
-    doc_ref = db.collection("documents").document(document_id)
-    doc = doc_ref.get()
-    
-    if not doc.exists:
-        raise NotFoundError("Document")
-    
-    doc_data = doc.to_dict()
-    
-    if doc_data.get("user_id") != current_user["id"]:
-        raise NotFoundError("Document")
+    doc_ref, doc_data = await _get_owned_document(db, document_id, current_user["id"])
     
     ocr_text = doc_data.get("ocr_text", "")
     if not ocr_text:
@@ -511,12 +704,13 @@ async def analyze_document(
     records = await ai_service.extract_health_data(ocr_text)
     
     # Store analysis results
-    doc_ref.update({
+    now = datetime.now(timezone.utc).isoformat()
+    await fs_run(doc_ref.update, {
         "analysis": {
             "records": records,
-            "analyzed_at": datetime.utcnow().isoformat(),
+            "analyzed_at": now,
         },
-        "updated_at": datetime.utcnow().isoformat(),
+        "updated_at": now,
     })
     
     return {
@@ -538,16 +732,7 @@ async def verify_document(
     Compares the stored hash with the current file hash to detect tampering.
     """
     db = get_db()
-    doc_ref = db.collection("documents").document(document_id)
-    doc = doc_ref.get()
-    
-    if not doc.exists:
-        raise NotFoundError("Document")
-    
-    doc_data = doc.to_dict()
-    
-    if doc_data.get("user_id") != current_user["id"]:
-        raise NotFoundError("Document")
+    doc_ref, doc_data = await _get_owned_document(db, document_id, current_user["id"])
     
     stored_hash = doc_data.get("content_hash", "")
     storage_path = doc_data.get("storage_path", "")
@@ -556,14 +741,15 @@ async def verify_document(
     current_hash = ""
     
     if storage_path:
-        file_data = download_from_storage(storage_path)
-        if file_data:
-            current_hash = compute_hash(file_data)
-            is_valid = current_hash == stored_hash
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+            if await download_to_file_async(storage_path, spool) and spool.tell():
+                spool.seek(0)
+                current_hash = hashlib.file_digest(spool, "sha256").hexdigest()
+                is_valid = current_hash == stored_hash
     
     # Update verification status
-    now = datetime.utcnow().isoformat()
-    doc_ref.update({
+    now = datetime.now(timezone.utc).isoformat()
+    await fs_run(doc_ref.update, {
         "last_verified_at": now,
         "integrity_valid": is_valid,
         "updated_at": now,
@@ -594,7 +780,7 @@ async def _run_background_analysis(
             logger.info(f"Background analysis completed for {doc_id}, auto-anchoring...")
             # Auto-anchor to blockchain after successful analysis
             try:
-                _auto_anchor_document(doc_id, doc_data, db)
+                await fs_run(_auto_anchor_document, doc_id, doc_data, db)
             except Exception as e:
                 logger.error(f"Auto-anchor failed for {doc_id}: {e}")
     except Exception as e:
@@ -615,7 +801,7 @@ def _auto_anchor_document(doc_id: str, doc_data: dict, db):
     if current.exists and current.to_dict().get("blockchain_tx_hash"):
         return
 
-    now = datetime.utcnow().isoformat()
+    now = datetime.now(timezone.utc).isoformat()
     tx_hash = "0x" + hashlib.sha256(
         f"{doc_id}:{content_hash}:{now}".encode()
     ).hexdigest()
@@ -660,12 +846,7 @@ async def get_document_analysis(
 ):
     """Get the AI analysis for a document."""
     db = get_db()
-    doc = db.collection("documents").document(document_id).get()
-    if not doc.exists:
-        raise NotFoundError("Document")
-    doc_data = doc.to_dict()
-    if doc_data.get("user_id") != current_user["id"]:
-        raise NotFoundError("Document")
+    _, doc_data = await _get_owned_document(db, document_id, current_user["id"])
 
     analysis = await analysis_service.get_analysis(document_id, db)
     if analysis:
@@ -690,14 +871,9 @@ async def reanalyze_document(
 ):
     """Re-trigger AI analysis for a document."""
     db = get_db()
-    doc = db.collection("documents").document(document_id).get()
-    if not doc.exists:
-        raise NotFoundError("Document")
-    doc_data = doc.to_dict()
-    if doc_data.get("user_id") != current_user["id"]:
-        raise NotFoundError("Document")
+    doc_ref, doc_data = await _get_owned_document(db, document_id, current_user["id"])
 
-    db.collection("documents").document(document_id).update({
+    await fs_run(doc_ref.update, {
         "analysis_status": "pending",
     })
 
@@ -1,6 +1,6 @@
 """Health Records routes - extraction, listing, trends, export."""
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any, List
 from uuid import uuid4
 from collections import defaultdict
@@ -10,8 +10,14 @@ from pydantic import BaseModel
 
 from app.core.auth import get_current_user
 from app.core.exceptions import NotFoundError
-from app.services.firebase import get_db
+from app.services.firebase import get_db, fs_get, fs_run, fs_stream
 from app.services.ai import ai_service
+from app.services.health_trends import (
+    BUCKETS_COLLECTION,
+    BUCKETS_VERSION,
+    add_to_buckets,
+    rebuild_buckets,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -44,10 +50,10 @@ async def list_health_records(
     if record_type:
         query = query.where("record_type", "==", record_type)
 
-    all_records = [doc.to_dict() for doc in query.stream()]
+    all_records = [doc.to_dict() for doc in await fs_stream(query)]
 
     # Filter by date window
-    cutoff = (datetime.utcnow() - timedelta(days=days_back)).isoformat()
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days_back)).isoformat()
     all_records = [
         r for r in all_records
         if r.get("created_at", r.get("effective_date", "")) >= cutoff
@@ -72,47 +78,56 @@ async def get_health_trends(
     """
     Get health data trends over time.
     
-    Groups records by type and returns time-series data points.
+    Groups records by test (type, name and unit) and returns one data
+    point per month, read from the precomputed `health_record_buckets`.
     """
     db = get_db()
     user_id = current_user["id"]
 
-    cutoff = (datetime.utcnow() - timedelta(days=months * 30)).isoformat()
+    # Backfill buckets for records written before bucketing existed, or
+    # bucketed under an older key
+    user_doc = await fs_get(db.collection("users").document(user_id))
+    built_version = user_doc.to_dict().get("health_buckets_version") if user_doc.exists else None
+    if built_version != BUCKETS_VERSION:
+        await fs_run(rebuild_buckets, db, user_id)
 
-    query = db.collection("health_records").where("user_id", "==", user_id)
+    cutoff_month = (datetime.now(timezone.utc) - timedelta(days=months * 30)).strftime("%Y-%m")
+
+    query = db.collection(BUCKETS_COLLECTION).where("user_id", "==", user_id)
 
     if record_type:
         query = query.where("record_type", "==", record_type)
 
-    all_records = [doc.to_dict() for doc in query.stream()]
-
-    # Filter by date
-    filtered = [
-        r for r in all_records
-        if r.get("effective_date", "") >= cutoff
-    ]
+    query = query.where("month", ">=", cutoff_month)
 
-    # Group by record_type
-    grouped: Dict[str, list] = defaultdict(list)
-    for r in filtered:
-        rt = r.get("record_type", "other")
-        grouped[rt].append(r)
+    # Group by series
+    grouped: Dict[tuple, list] = defaultdict(list)
+    for doc in await fs_stream(query):
+        bucket = doc.to_dict()
+        grouped[(
+            bucket.get("record_type", "other"),
+            bucket.get("name", "Unknown"),
+            bucket.get("unit", ""),
+        )].append(bucket)
 
     trends = []
-    for rt, records in grouped.items():
-        records.sort(key=lambda r: r.get("effective_date", ""))
-        unit = records[0].get("value_unit", "") if records else ""
+    for (rt, name, unit), buckets in grouped.items():
+        buckets.sort(key=lambda b: b["month"])
         data_points = [
             {
-                "date": r.get("effective_date", ""),
-                "value": r.get("value_numeric"),
-                "is_abnormal": r.get("is_abnormal", False),
+                "date": b["month"],
+                "value": b["sum"] / b["count"],
+                "min": b["min"],
+                "max": b["max"],
+                "count": b["count"],
+                "is_abnormal": b.get("abnormal_count", 0) > 0,
             }
-            for r in records
-            if r.get("value_numeric") is not None
+            for b in buckets
+            if b.get("count")
         ]
         trends.append({
             "record_type": rt,
+            "name": name,
             "unit": unit,
             "data_points": data_points,
         })
@@ -141,7 +156,7 @@ async def extract_health_records(
 
     # Get the document
     doc_ref = db.collection("documents").document(document_id)
-    doc = doc_ref.get()
+    doc = await fs_get(doc_ref)
 
     if not doc.exists:
         raise NotFoundError("Document")
@@ -163,7 +178,7 @@ async def extract_health_records(
 
     # Save each record to Firestore
     saved_records = []
-    now = datetime.utcnow().isoformat()
+    now = datetime.now(timezone.utc).isoformat()
 
     for record in raw_records:
         record_id = str(uuid4())
@@ -202,11 +217,13 @@ async def extract_health_records(
             "created_at": now,
         }
 
-        db.collection("health_records").document(record_id).set(health_record)
+        await fs_run(db.collection("health_records").document(record_id).set, health_record)
         saved_records.append(health_record)
 
+    await fs_run(add_to_buckets, db, user_id, saved_records)
+
     # Mark document as extracted
-    doc_ref.update({
+    await fs_run(doc_ref.update, {
         "health_records_extracted": True,
         "extraction_count": len(saved_records),
         "updated_at": now,
@@ -239,11 +256,13 @@ async def sync_health_records(
 
     # 1) Gather all user health records
     hr_query = db.collection("health_records").where("user_id", "==", user_id)
-    all_hr = [(doc.id, doc.to_dict()) for doc in hr_query.stream()]
+    all_hr = [(doc.id, doc.to_dict()) for doc in await fs_stream(hr_query)]
 
-    # 2) Gather all user document ids
-    doc_query = db.collection("documents").where("user_id", "==", user_id)
-    user_docs = {d.id: d.to_dict() for d in doc_query.stream()}
+    # 2) Gather all user document ids (metadata only, not the OCR text)
+    doc_query = db.collection("documents") \
+        .where("user_id", "==", user_id) \
+        .select(["status", "health_records_extracted", "created_at"])
+    user_docs = {d.id: d.to_dict() for d in await fs_stream(doc_query)}
     active_doc_ids = {
         doc_id for doc_id, d in user_docs.items()
         if d.get("status") != "deleted"
@@ -251,29 +270,52 @@ async def sync_health_records(
 
     # 3) Delete orphaned records whose source document is gone
     deleted_count = 0
+    remaining_hr = []
     for hr_id, hr_data in all_hr:
         src_doc = hr_data.get("document_id")
         if src_doc and src_doc not in active_doc_ids:
-            db.collection("health_records").document(hr_id).delete()
+            await fs_run(db.collection("health_records").document(hr_id).delete)
             deleted_count += 1
+        else:
+            remaining_hr.append(hr_data)
+
+    if deleted_count:
+        await fs_run(rebuild_buckets, db, user_id, remaining_hr)
 
     # 4) Auto-extract from recent unextracted documents
-    cutoff_30 = (datetime.utcnow() - timedelta(days=30)).isoformat()
+    now_dt = datetime.now(timezone.utc)
+    now = now_dt.isoformat()
+    cutoff_30 = (now_dt - timedelta(days=30)).isoformat()
+    to_extract = [
+        db.collection("documents").document(doc_id)
+        for doc_id, doc_data in user_docs.items()
+        if doc_data.get("status") != "deleted"
+        and not doc_data.get("health_records_extracted")
+        and doc_data.get("created_at", "") >= cutoff_30
+    ]
+
+    # Fetch OCR text only for the documents that need extraction
+    ocr_docs = []
+    if to_extract:
+        ocr_docs = await fs_run(
+            lambda: list(db.get_all(to_extract, field_paths=["ocr_text"]))
+        )
+
+    pending = []
+    for ocr_doc in ocr_docs:
+        ocr_text = (ocr_doc.to_dict() or {}).get("ocr_text", "")
+        if ocr_text.strip():
+            pending.append((ocr_doc.id, ocr_text))
+
+    # Run AI extraction for all pending documents concurrently
+    extractions = await ai_service.extract_health_data_batch(
+        [ocr_text for _, ocr_text in pending]
+    )
+
     extracted_count = 0
-    for doc_id, doc_data in user_docs.items():
-        if doc_data.get("status") == "deleted":
-            continue
-        if doc_data.get("health_records_extracted"):
-            continue
-        if doc_data.get("created_at", "") < cutoff_30:
-            continue
-        ocr_text = doc_data.get("ocr_text", "")
-        if not ocr_text.strip():
-            continue
-        # Run AI extraction
+    for (doc_id, _), raw_records in zip(pending, extractions):
         try:
-            raw_records = await ai_service.extract_health_data(ocr_text)
-            now = datetime.utcnow().isoformat()
+            new_records = []
             for record in raw_records:
                 record_id = str(uuid4())
                 health_record = {
@@ -302,9 +344,11 @@ async def sync_health_records(
                     },
                     "created_at": now,
                 }
-                db.collection("health_records").document(record_id).set(health_record)
+                await fs_run(db.collection("health_records").document(record_id).set, health_record)
+                new_records.append(health_record)
                 extracted_count += 1
-            db.collection("documents").document(doc_id).update({
+            await fs_run(add_to_buckets, db, user_id, new_records)
+            await fs_run(db.collection("documents").document(doc_id).update, {
                 "health_records_extracted": True,
                 "extraction_count": len(raw_records),
                 "updated_at": now,
@@ -339,7 +383,7 @@ async def export_health_records(
     if record_type:
         query = query.where("record_type", "==", record_type)
 
-    all_records = [doc.to_dict() for doc in query.stream()]
+    all_records = [doc.to_dict() for doc in await fs_stream(query)]
 
     # Build FHIR Bundle
     bundle = {
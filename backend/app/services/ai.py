@@ -5,15 +5,32 @@ Supports three providers (set AI_PROVIDER in .env):
   - "huggingface"  →  Qwen2.5-VL-72B via HF Inference API
   - "nvidia"       →  meta/llama-3.1-70b-instruct via NVIDIA API  (paused)
 """
-import json
+import asyncio
+import dataclasses
+import functools
+import hashlib
 import logging
+import math
+import re
 import time
-import base64
-from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict, deque
+from typing import Dict, Any, AsyncIterator, Iterable, Iterator, List, Optional, Sequence, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
 import httpx
+import numpy as np
+import orjson
+
+try:
+    import ahocorasick
+except ImportError:  # keyword matching falls back to a flat substring scan
+    ahocorasick = None
+
+try:
+    import pybase64 as base64  # SIMD base64, same API as the stdlib module
+except ImportError:
+    import base64
 
 from app.config import settings
 from app.core.exceptions import AIServiceError
@@ -40,6 +57,67 @@ class AIResponse:
     has_document_context: bool = False
 
 
+def _build_matcher(entries: Iterable[Tuple[str, Any]]) -> Any:
+    """
+    Compile (keyword, payload) pairs into a keyword matcher for _scan().
+
+    Uses a single Aho-Corasick automaton when pyahocorasick is installed,
+    otherwise a flat tuple of (keyword, payloads) checked with `in`.
+    """
+    owners: Dict[str, List[Any]] = {}
+    for keyword, payload in entries:
+        owners.setdefault(keyword, []).append(payload)
+
+    if ahocorasick is None:
+        return tuple((keyword, tuple(payloads)) for keyword, payloads in owners.items())
+
+    automaton = ahocorasick.Automaton()
+    for keyword, payloads in owners.items():
+        automaton.add_word(keyword, (keyword, tuple(payloads)))
+    automaton.make_automaton()
+    return automaton
+
+
+def _scan(matcher: Any, text: str) -> Iterator[Tuple[str, Tuple[Any, ...]]]:
+    """Yield (keyword, payloads) once for every distinct keyword found in `text`."""
+    if isinstance(matcher, tuple):
+        for keyword, payloads in matcher:
+            if keyword in text:
+                yield keyword, payloads
+        return
+
+    seen = set()
+    for _, (keyword, payloads) in matcher.iter(text):
+        if keyword not in seen:
+            seen.add(keyword)
+            yield keyword, payloads
+
+
+def _expert_keywords(experts: Dict[ExpertType, Dict[str, Any]]) -> Iterable[Tuple[str, ExpertType]]:
+    """Yield (keyword, expert_type) for every expert keyword."""
+    for expert_type, config in experts.items():
+        for keyword in config["keywords"]:
+            yield keyword, expert_type
+
+
+def _compile_prompts(
+    patient_experts: Dict[ExpertType, Dict[str, Any]],
+    doctor_experts: Dict[ExpertType, Dict[str, Any]],
+    patient_suffix: str,
+    doctor_suffix: str,
+) -> Dict[Tuple[bool, ExpertType, bool], str]:
+    """Build every (is_medical_professional, expert, has_document) system prompt once."""
+    prompts: Dict[Tuple[bool, ExpertType, bool], str] = {}
+    for is_professional, experts, suffix in (
+        (False, patient_experts, patient_suffix),
+        (True, doctor_experts, doctor_suffix),
+    ):
+        for expert_type, config in experts.items():
+            prompts[(is_professional, expert_type, False)] = config["system_prompt"]
+            prompts[(is_professional, expert_type, True)] = config["system_prompt"] + suffix
+    return prompts
+
+
 class MedicalExpertRouter:
     """
     Routes queries to specialized medical experts based on content analysis.
@@ -221,6 +299,60 @@ When document context is provided, perform comprehensive clinical analysis.""",
         },
     }
     
+    # Appended to the expert prompt when a document is attached
+    DOCTOR_DOCUMENT_SUFFIX = """
+
+IMPORTANT: You have been provided with the patient's medical document.
+Perform thorough clinical analysis of this document.
+Reference specific values, dates, findings, and clinical correlations.
+Provide differential diagnoses where the data supports it.
+Suggest additional investigations or follow-up as clinically indicated.
+If asked about something not in the document, clearly state that."""
+    
+    PATIENT_DOCUMENT_SUFFIX = """
+
+IMPORTANT: You have been provided with the user's medical document. 
+Use this document to answer their questions accurately.
+Reference specific values, dates, and findings from the document.
+If asked about something not in the document, clearly state that."""
+    
+    # System prompt for multimodal scan analysis (replaces expert routing)
+    SCAN_SYSTEM_PROMPT = (
+        "You are a medical imaging analysis assistant specialised in "
+        "reading X-rays, CT scans, and MRI scans.\n\n"
+        "You MUST structure your response in EXACTLY the following order "
+        "using these markdown headings. Do NOT skip any section:\n\n"
+        "## Detailed Analysis\n"
+        "Describe ALL observations you see in the image(s) — anatomical "
+        "structures, abnormalities, densities, contrast, and any clinically "
+        "relevant findings. Group findings by anatomical region. "
+        "If the user is a patient, explain in simple language. "
+        "If the user is a medical professional, use clinical terminology.\n\n"
+        "## Summary\n"
+        "Provide a concise 2-4 sentence summary of the most important "
+        "findings from the analysis above.\n\n"
+        "## Results\n"
+        "List ONLY the key results as bullet points — no extra explanation, "
+        "just the factual findings (e.g., '- Normal ventricular size', "
+        "'- White matter hyperintensities in periventricular region').\n\n"
+        "## Predicted Condition\n"
+        "Based on the imaging findings, list the most likely condition(s) "
+        "or differential diagnoses, ranked by probability. "
+        "State clearly that this is an AI-based prediction, NOT a diagnosis. "
+        "ALWAYS recommend consulting a qualified radiologist or physician "
+        "for an official diagnosis.\n\n"
+        "Do NOT add any disclaimer at the end — one will be appended automatically."
+    )
+    
+    # One keyword matcher per expert set, so routing is a single scan
+    _PATIENT_MATCHER = _build_matcher(_expert_keywords(PATIENT_EXPERTS))
+    _DOCTOR_MATCHER = _build_matcher(_expert_keywords(DOCTOR_EXPERTS))
+    
+    # Final system prompts keyed by (is_medical_professional, expert, has_document)
+    _COMPILED_PROMPTS = _compile_prompts(
+        PATIENT_EXPERTS, DOCTOR_EXPERTS, PATIENT_DOCUMENT_SUFFIX, DOCTOR_DOCUMENT_SUFFIX,
+    )
+    
     def route(self, query: str, has_document: bool = False, user_role: str = "patient") -> Tuple[ExpertType, str]:
         """
         Route query to appropriate expert based on content analysis and user role.
@@ -231,28 +363,30 @@ When document context is provided, perform comprehensive clinical analysis.""",
             user_role: User's role (patient, doctor, clinician)
             
         Returns:
-            Tuple of (expert_type, system_prompt)
+            Tuple of (expert_type, system_prompt), with the document
+            instructions already appended when has_document is set
         """
         # Select expert set based on role
         is_medical_professional = user_role in ("doctor", "clinician", "admin")
-        experts = self.DOCTOR_EXPERTS if is_medical_professional else self.PATIENT_EXPERTS
+        if is_medical_professional:
+            experts, matcher = self.DOCTOR_EXPERTS, self._DOCTOR_MATCHER
+        else:
+            experts, matcher = self.PATIENT_EXPERTS, self._PATIENT_MATCHER
         
-        query_lower = query.lower()
+        # Each distinct keyword found scores one point for its experts
         scores: Dict[ExpertType, int] = {}
-        
-        for expert_type, config in experts.items():
-            if not config["keywords"]:
-                continue
-            score = sum(1 for kw in config["keywords"] if kw in query_lower)
-            if score > 0:
-                scores[expert_type] = score
+        for _, expert_types in _scan(matcher, query.lower()):
+            for expert_type in expert_types:
+                scores[expert_type] = scores.get(expert_type, 0) + 1
         
         if scores:
-            best_expert = max(scores, key=scores.get)
+            # Ties go to the expert defined first
+            best_expert = max((et for et in experts if et in scores), key=scores.get)
             logger.info(f"MoE routed to: {best_expert.value} (score: {scores[best_expert]}, role: {user_role})")
-            return best_expert, experts[best_expert]["system_prompt"]
+        else:
+            best_expert = ExpertType.GENERAL
         
-        return ExpertType.GENERAL, experts[ExpertType.GENERAL]["system_prompt"]
+        return best_expert, self._COMPILED_PROMPTS[(is_medical_professional, best_expert, has_document)]
 
 
 class SafetyGuard:
@@ -268,16 +402,45 @@ class SafetyGuard:
         "your treatment should be",
     ]
     
+    DIAGNOSIS_KEYWORDS = [
+        "diagnose", "diagnosis", "what disease", "what condition",
+        "am i sick", "do i have", "is it cancer", "prescribe",
+    ]
+    
+    # One case-insensitive alternation per list, used as a yes/no prefilter
+    _BLOCKED_RE = re.compile(
+        "|".join(map(re.escape, sorted(BLOCKED_PATTERNS, key=len, reverse=True))),
+        re.IGNORECASE,
+    )
+    _DIAGNOSIS_RE = re.compile(
+        "|".join(map(re.escape, sorted(DIAGNOSIS_KEYWORDS, key=len, reverse=True))),
+        re.IGNORECASE,
+    )
+    
+    # Disclaimers the model writes itself; the reply is cut at the earliest one
+    _DISCLAIMER_RE = re.compile(
+        "|".join(map(re.escape, ["⚠️ MEDICAL DISCLAIMER", "MEDICAL DISCLAIMER:"])),
+        re.IGNORECASE,
+    )
+    
+    @staticmethod
+    def _find(pattern: "re.Pattern[str]", text: str, phrases: List[str]) -> List[str]:
+        """
+        Return every phrase occurring in `text`, in list order.
+
+        The combined `pattern` only decides whether anything matches; the
+        per-phrase scan then reports overlapping phrases too, which a single
+        alternation would swallow.
+        """
+        if not pattern.search(text):
+            return []
+        lowered = text.lower()
+        return [phrase for phrase in phrases if phrase in lowered]
+    
     @staticmethod
     def check_input(query: str) -> Dict[str, Any]:
         """Check if user is asking for diagnosis."""
-        diagnosis_keywords = [
-            "diagnose", "diagnosis", "what disease", "what condition",
-            "am i sick", "do i have", "is it cancer", "prescribe",
-        ]
-        
-        query_lower = query.lower()
-        flags = [kw for kw in diagnosis_keywords if kw in query_lower]
+        flags = SafetyGuard._find(SafetyGuard._DIAGNOSIS_RE, query, SafetyGuard.DIAGNOSIS_KEYWORDS)
         
         return {
             "is_safe": len(flags) == 0,
@@ -290,10 +453,10 @@ class SafetyGuard:
         """Sanitize AI response. Only adds disclaimer when add_disclaimer=True (first message)."""
         # Check for blocked patterns (only for patient-facing responses)
         if user_role == "patient":
-            response_lower = response.lower()
-            for pattern in SafetyGuard.BLOCKED_PATTERNS:
-                if pattern in response_lower:
-                    logger.warning(f"Blocked pattern detected in AI response: {pattern}")
+            for pattern in SafetyGuard._find(
+                SafetyGuard._BLOCKED_RE, response, SafetyGuard.BLOCKED_PATTERNS,
+            ):
+                logger.warning(f"Blocked pattern detected in AI response: {pattern}")
         
         # No disclaimer for doctors
         if user_role in ("doctor", "clinician", "admin"):
@@ -301,11 +464,9 @@ class SafetyGuard:
         
         # Strip any disclaimer the model may have already generated
         cleaned = response
-        disclaimer_markers = ["⚠️ MEDICAL DISCLAIMER", "MEDICAL DISCLAIMER:", "⚠️ medical disclaimer"]
-        for marker in disclaimer_markers:
-            idx = cleaned.lower().find(marker.lower())
-            if idx != -1:
-                cleaned = cleaned[:idx].rstrip()
+        match = SafetyGuard._DISCLAIMER_RE.search(response)
+        if match:
+            cleaned = response[:match.start()].rstrip()
         
         # Only add disclaimer on first message of conversation
         if add_disclaimer:
@@ -313,6 +474,154 @@ class SafetyGuard:
         return cleaned
 
 
+class _ResponseCache:
+    """
+    Small LRU cache with per-entry expiry for chat responses.
+    
+    Only touched from the event loop thread and never awaits, so it needs
+    no locking.
+    """
+    
+    def __init__(self, maxsize: int = 2048, ttl: float = 900.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, Tuple[float, AIResponse]]" = OrderedDict()
+    
+    def get(self, key: bytes) -> Optional[AIResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+    
+    def set(self, key: bytes, response: AIResponse) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+def _data_url_fragment(data: bytes, mime_type: str) -> orjson.Fragment:
+    """
+    Build a base64 data: URL as an already-serialized JSON string.
+    
+    orjson copies the fragment into the request body verbatim, so a large
+    image is encoded once and joined once, with no intermediate str copies.
+    """
+    # Quoted, escaped prefix without its closing quote
+    prefix = orjson.dumps(f"data:{mime_type};base64,")[:-1]
+    return orjson.Fragment(b"".join((prefix, base64.b64encode(data), b'"')))
+
+
+def _to_float(value: Any) -> float:
+    """Parse a model-reported number; NaN when missing or not numeric."""
+    if value is None or isinstance(value, bool):
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _normalize_health_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Recompute is_abnormal from each value and its reference range.
+    
+    The comparisons run column-wise over the whole batch. The model's own
+    flag is kept where the value or both range bounds aren't numeric.
+    """
+    if not records:
+        return records
+    
+    count = len(records)
+    values = np.fromiter((_to_float(r.get("value")) for r in records), float, count)
+    lows = np.fromiter((_to_float(r.get("reference_range_low")) for r in records), float, count)
+    highs = np.fromiter((_to_float(r.get("reference_range_high")) for r in records), float, count)
+    
+    # NaN compares False, so a missing bound never marks a value abnormal
+    abnormal = (values < lows) | (values > highs)
+    checkable = ~np.isnan(values) & ~(np.isnan(lows) & np.isnan(highs))
+    
+    for record, check, flag in zip(records, checkable.tolist(), abnormal.tolist()):
+        if check:
+            record["is_abnormal"] = flag
+    return records
+
+
+@functools.lru_cache(maxsize=64)
+def _payload_prefix(
+    model: str,
+    system_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    stream: bool,
+) -> bytes:
+    """
+    Serialized chat request body, open after the system message.
+    
+    System prompts are long and come from a small fixed set, so their JSON
+    encoding is done once and reused across requests.
+    """
+    body: Dict[str, Any] = {
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "top_p": 0.9,
+    }
+    if stream:
+        body["stream"] = True
+        body["stream_options"] = {"include_usage": True}
+    # "messages" last so the encoding ends in "]}"
+    body["messages"] = [{"role": "system", "content": system_prompt}]
+    return orjson.dumps(body)[:-2] + b","
+
+
+# Prior conversation messages sent with each chat turn
+HISTORY_LIMIT = 10
+
+
+def _recent_history(
+    conversation_history: Optional[Iterable[Dict[str, str]]],
+) -> Sequence[Dict[str, str]]:
+    """
+    Return the last HISTORY_LIMIT messages of a conversation.
+    
+    Lists are sliced (copying at most HISTORY_LIMIT references); a deque
+    already bounded by maxlen is used as is; any other iterable is
+    consumed through a bounded deque.
+    """
+    if not conversation_history:
+        return ()
+    if isinstance(conversation_history, deque):
+        if conversation_history.maxlen is not None and conversation_history.maxlen <= HISTORY_LIMIT:
+            return conversation_history
+    elif isinstance(conversation_history, Sequence):
+        return conversation_history[-HISTORY_LIMIT:]
+    return deque(conversation_history, maxlen=HISTORY_LIMIT)
+
+
+def _chat_cache_key(
+    query: str,
+    document_context: Optional[str],
+    history: Sequence[Dict[str, str]],
+    user_role: str,
+) -> bytes:
+    """BLAKE2b digest of everything that shapes a text-only chat reply."""
+    query_digest = hashlib.blake2b(query.encode(), digest_size=16).digest()
+    doc_digest = hashlib.blake2b((document_context or "")[:8000].encode(), digest_size=16).digest()
+    h = hashlib.blake2b(digest_size=16)
+    for msg in history:
+        h.update(msg.get("role", "user").encode())
+        h.update(b"\0")
+        h.update(str(msg.get("content", "")).encode())
+        h.update(b"\0")
+    return query_digest + doc_digest + h.digest() + user_role.encode()
+
+
 class AIService:
     """
     AI service using NVIDIA API (Llama 3.1) for medical document intelligence.
@@ -328,27 +637,79 @@ class AIService:
         """Initialize AI service based on configured provider."""
         self.router = MedicalExpertRouter()
         self.safety = SafetyGuard()
+        self._response_cache = _ResponseCache()
         self.provider = settings.AI_PROVIDER.lower()
 
+        headers = {"Content-Type": "application/json"}
+
         if self.provider == "local":
             self._available = bool(settings.LOCAL_MODEL_PATH)
+            timeout = 300.0
             if self._available:
                 logger.info(f"AI Service configured for local model: {settings.LOCAL_MODEL_PATH}")
             else:
                 logger.warning("LOCAL_MODEL_PATH not set - AI features disabled")
         elif self.provider == "huggingface":
             self._available = bool(settings.HF_API_KEY)
+            timeout = 120.0
+            headers["Authorization"] = f"Bearer {settings.HF_API_KEY}"
             if not self._available:
                 logger.warning("HF_API_KEY not configured - AI features disabled")
             else:
                 logger.info(f"AI Service initialized with HuggingFace model: {settings.HF_MODEL}")
         else:
             self._available = bool(settings.NVIDIA_API_KEY)
+            timeout = 90.0
+            headers["Authorization"] = f"Bearer {settings.NVIDIA_API_KEY}"
             if not self._available:
                 logger.warning("NVIDIA API key not configured - AI features disabled")
             else:
                 logger.info(f"AI Service initialized with NVIDIA model: {settings.NVIDIA_MODEL}")
 
+        # One pooled client for the active provider, so connections (and
+        # TLS sessions) are reused across requests instead of per call
+        self._client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+            headers=headers,
+        )
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP client. Called on application shutdown."""
+        await self._client.aclose()
+
+    @staticmethod
+    def _chat_payload(
+        model: str,
+        system_prompt: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        stream: bool = False,
+    ) -> bytes:
+        """
+        Serialize an OpenAI-format chat request body.
+        
+        The part up to and including the system message comes pre-serialized
+        from _payload_prefix(); only the conversation messages are encoded per
+        call. The "model" role is mapped to "assistant".
+        """
+        api_messages = []
+        for msg in messages:
+            role = msg.get("role", "user")
+            if role == "model":
+                role = "assistant"
+            api_messages.append({
+                "role": role,
+                "content": msg.get("content", ""),
+            })
+        prefix = _payload_prefix(model, system_prompt, temperature, max_tokens, stream)
+        if not api_messages:
+            return prefix[:-1] + b"]}"
+        # orjson.dumps(list) is "[...]": drop its "[" and close the object
+        return prefix + orjson.dumps(api_messages)[1:] + b"}"
+
     # ------------------------------------------------------------------
     # Local model inference via llama-server (OpenAI-compatible API)
     # ------------------------------------------------------------------
@@ -367,39 +728,20 @@ class AIService:
         """
         llama_url = f"{settings.LLAMA_SERVER_URL}/v1/chat/completions"
 
-        # Build OpenAI-format messages
-        api_messages: List[Dict[str, Any]] = [
-            {"role": "system", "content": system_prompt}
-        ]
-        for msg in messages:
-            role = msg.get("role", "user")
-            if role == "model":
-                role = "assistant"
-            api_messages.append({
-                "role": role,
-                "content": msg.get("content", ""),
-            })
-
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            response = await client.post(
-                llama_url,
-                headers={"Content-Type": "application/json"},
-                json={
-                    "model": "MediX-R1-8B",
-                    "messages": api_messages,
-                    "temperature": temperature,
-                    "max_tokens": min(max_tokens, 17000),
-                    "top_p": 0.9,
-                },
-            )
-            response.raise_for_status()
-            data = response.json()
+        response = await self._client.post(
+            llama_url,
+            content=self._chat_payload(
+                "MediX-R1-8B", system_prompt, messages, temperature, min(max_tokens, 17000),
+            ),
+        )
+        response.raise_for_status()
+        data = orjson.loads(response.content)
 
-            return {
-                "text": data["choices"][0]["message"]["content"],
-                "tokens": data.get("usage", {}).get("total_tokens", 0),
-                "model": "MediX-R1-8B",
-            }
+        return {
+            "text": data["choices"][0]["message"]["content"],
+            "tokens": data.get("usage", {}).get("total_tokens", 0),
+            "model": "MediX-R1-8B",
+        }
 
     # ------------------------------------------------------------------
     # HuggingFace Inference API  (MBZUAI/MediX-R1-30B)
@@ -420,41 +762,18 @@ class AIService:
         model = model or settings.HF_MODEL
         hf_url = f"{settings.HF_INFERENCE_URL}/chat/completions"
 
-        api_messages: List[Dict[str, Any]] = [
-            {"role": "system", "content": system_prompt}
-        ]
-        for msg in messages:
-            role = msg.get("role", "user")
-            if role == "model":
-                role = "assistant"
-            api_messages.append({
-                "role": role,
-                "content": msg.get("content", ""),
-            })
-
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                hf_url,
-                headers={
-                    "Authorization": f"Bearer {settings.HF_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": model,
-                    "messages": api_messages,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "top_p": 0.9,
-                },
-            )
-            response.raise_for_status()
-            data = response.json()
+        response = await self._client.post(
+            hf_url,
+            content=self._chat_payload(model, system_prompt, messages, temperature, max_tokens),
+        )
+        response.raise_for_status()
+        data = orjson.loads(response.content)
 
-            return {
-                "text": data["choices"][0]["message"]["content"],
-                "tokens": data.get("usage", {}).get("total_tokens", 0),
-                "model": model,
-            }
+        return {
+            "text": data["choices"][0]["message"]["content"],
+            "tokens": data.get("usage", {}).get("total_tokens", 0),
+            "model": model,
+        }
 
     # ------------------------------------------------------------------
     # NVIDIA API  (LLaMA 3.1 70B – paused)
@@ -483,161 +802,124 @@ class AIService:
         """
         model = model or settings.NVIDIA_MODEL
         
-        # Build API messages
-        api_messages = [{"role": "system", "content": system_prompt}]
-        for msg in messages:
-            role = msg.get("role", "user")
-            if role == "model":
-                role = "assistant"
-            api_messages.append({
-                "role": role,
-                "content": msg.get("content", "")
-            })
+        response = await self._client.post(
+            f"{settings.NVIDIA_BASE_URL}/chat/completions",
+            content=self._chat_payload(model, system_prompt, messages, temperature, max_tokens),
+        )
+        response.raise_for_status()
+        data = orjson.loads(response.content)
         
-        async with httpx.AsyncClient(timeout=90.0) as client:
-            response = await client.post(
-                f"{settings.NVIDIA_BASE_URL}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.NVIDIA_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": model,
-                    "messages": api_messages,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "top_p": 0.9,
-                },
-            )
+        return {
+            "text": data["choices"][0]["message"]["content"],
+            "tokens": data.get("usage", {}).get("total_tokens", 0),
+            "model": model,
+        }
+    
+    # ------------------------------------------------------------------
+    # Streaming (all providers speak OpenAI-compatible SSE)
+    # ------------------------------------------------------------------
+    def _completion_target(self) -> Tuple[str, str, int]:
+        """Return (chat completions URL, model, max_tokens cap) for the active provider."""
+        if self.provider == "local":
+            return f"{settings.LLAMA_SERVER_URL}/v1/chat/completions", "MediX-R1-8B", 17000
+        if self.provider == "huggingface":
+            return f"{settings.HF_INFERENCE_URL}/chat/completions", settings.HF_MODEL, 4096
+        return f"{settings.NVIDIA_BASE_URL}/chat/completions", settings.NVIDIA_MODEL, 4096
+
+    async def _stream_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        system_prompt: str,
+        max_tokens: int = 4096,
+        temperature: float = 0.3,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion from the active provider, yielding text deltas.
+        
+        If `usage` is given, it is filled from the usage block of the final
+        chunk when the provider sends one.
+        """
+        url, model, token_cap = self._completion_target()
+        payload = self._chat_payload(
+            model, system_prompt, messages, temperature, min(max_tokens, token_cap), stream=True,
+        )
+        
+        async with self._client.stream("POST", url, content=payload) as response:
             response.raise_for_status()
-            data = response.json()
-            
-            return {
-                "text": data["choices"][0]["message"]["content"],
-                "tokens": data.get("usage", {}).get("total_tokens", 0),
-                "model": model,
-            }
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = orjson.loads(data)
+                if usage is not None and chunk.get("usage"):
+                    usage.update(chunk["usage"], model=chunk.get("model", model))
+                for choice in chunk.get("choices") or ():
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
     
-    async def chat(
+    def _prepare_chat(
         self,
         query: str,
-        document_context: Optional[str] = None,
-        conversation_history: Optional[List[Dict[str, str]]] = None,
-        user_role: str = "patient",
-        scan_images: Optional[List[Dict[str, Any]]] = None,
-    ) -> AIResponse:
+        document_context: Optional[str],
+        history: Sequence[Dict[str, str]],
+        user_role: str,
+        scan_images: Optional[List[Dict[str, Any]]],
+    ) -> Tuple[ExpertType, str, List[Dict[str, Any]], bool]:
         """
-        Process a chat query with optional document context.
-        Adapts response style based on user role.
+        Route the query and build the system prompt and messages for a chat turn.
         
-        Args:
-            query: User's question
-            document_context: OCR text from linked document
-            conversation_history: Previous messages in conversation
-            user_role: User's role (patient, doctor, clinician)
-            scan_images: Optional list of dicts with keys
-                         {"data": bytes, "mime_type": str, "filename": str}
-                         for imaging/radiology documents to be analysed
-                         visually by MediX-R1-30B.
-            
         Returns:
-            AIResponse with content and metadata
+            (expert_type, system_prompt, messages, has_document)
         """
-        start_time = time.time()
         has_scan = bool(scan_images)
-        has_document = bool(document_context and document_context.strip()) or has_scan
+        # isspace() answers "any text?" without copying the whole context like strip()
+        has_text = bool(document_context) and not document_context.isspace()
+        has_document = has_text or has_scan
         is_medical_professional = user_role in ("doctor", "clinician", "admin")
         
-        # Safety check (relaxed for medical professionals)
-        safety_check = self.safety.check_input(query)
-        
-        # Route to expert with role awareness
-        expert_type, system_prompt = self.router.route(query, has_document, user_role)
-        
-        # Enhance system prompt with document awareness
-        if has_document and is_medical_professional:
-            system_prompt += """
-
-IMPORTANT: You have been provided with the patient's medical document.
-Perform thorough clinical analysis of this document.
-Reference specific values, dates, findings, and clinical correlations.
-Provide differential diagnoses where the data supports it.
-Suggest additional investigations or follow-up as clinically indicated.
-If asked about something not in the document, clearly state that."""
-        elif has_document:
-            system_prompt += """
-
-IMPORTANT: You have been provided with the user's medical document. 
-Use this document to answer their questions accurately.
-Reference specific values, dates, and findings from the document.
-If asked about something not in the document, clearly state that."""
-        
-        # Build conversation messages
-        messages: List[Dict[str, str]] = []
-        
-        # Add conversation history (last 10 messages)
-        if conversation_history:
-            for msg in conversation_history[-10:]:
-                messages.append({
-                    "role": msg.get("role", "user"),
-                    "content": msg.get("content", ""),
-                })
+        # Build conversation messages, starting from the recent history
+        # (_chat_payload reads role/content, so the dicts are not copied)
+        messages: List[Dict[str, Any]] = list(history)
         
         # Build the user message with document context
         if has_scan:
             # ── Multimodal scan analysis ──────────────────────────────
+            # Scans always go to the imaging prompt; no keyword routing
+            expert_type = ExpertType.RADIOLOGY
+            system_prompt = self.router.SCAN_SYSTEM_PROMPT
+            
             # Build a multimodal content list with images + text for
             # the vision-language model (MediX-R1-30B).
             content_parts: List[Dict[str, Any]] = []
             for img_info in scan_images:  # type: ignore[union-attr]
-                img_b64 = base64.b64encode(img_info["data"]).decode("utf-8")
                 content_parts.append({
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:{img_info['mime_type']};base64,{img_b64}"
+                        "url": _data_url_fragment(img_info["data"], img_info["mime_type"])
                     },
                 })
             prompt_text = query
-            if document_context and document_context.strip():
+            if has_text:
                 prompt_text = (
                     f"Additional document text:\n{document_context[:4000]}\n\n"
                     f"User's question: {query}"
                 )
             content_parts.append({"type": "text", "text": prompt_text})
 
-            # Override system prompt for scan analysis
-            system_prompt = (
-                "You are a medical imaging analysis assistant specialised in "
-                "reading X-rays, CT scans, and MRI scans.\n\n"
-                "You MUST structure your response in EXACTLY the following order "
-                "using these markdown headings. Do NOT skip any section:\n\n"
-                "## Detailed Analysis\n"
-                "Describe ALL observations you see in the image(s) — anatomical "
-                "structures, abnormalities, densities, contrast, and any clinically "
-                "relevant findings. Group findings by anatomical region. "
-                "If the user is a patient, explain in simple language. "
-                "If the user is a medical professional, use clinical terminology.\n\n"
-                "## Summary\n"
-                "Provide a concise 2-4 sentence summary of the most important "
-                "findings from the analysis above.\n\n"
-                "## Results\n"
-                "List ONLY the key results as bullet points — no extra explanation, "
-                "just the factual findings (e.g., '- Normal ventricular size', "
-                "'- White matter hyperintensities in periventricular region').\n\n"
-                "## Predicted Condition\n"
-                "Based on the imaging findings, list the most likely condition(s) "
-                "or differential diagnoses, ranked by probability. "
-                "State clearly that this is an AI-based prediction, NOT a diagnosis. "
-                "ALWAYS recommend consulting a qualified radiologist or physician "
-                "for an official diagnosis.\n\n"
-                "Do NOT add any disclaimer at the end — one will be appended automatically."
-            )
-            expert_type = ExpertType.RADIOLOGY
-
             messages.append({"role": "user", "content": content_parts})
         else:
+            # Route to expert with role awareness (prompt is already document-aware)
+            expert_type, system_prompt = self.router.route(query, has_document, user_role)
+            
+            # Safety check (relaxed for medical professionals)
+            safety_check = self.safety.check_input(query)
+            
             user_content = query
-            if document_context and document_context.strip():
+            if has_text:
                 user_content = f"""Here is the medical document content:
 
 ---BEGIN DOCUMENT---
@@ -657,6 +939,49 @@ Please explain the relevant medical concepts instead."""
 
             messages.append({"role": "user", "content": user_content})
         
+        return expert_type, system_prompt, messages, has_document
+    
+    async def chat(
+        self,
+        query: str,
+        document_context: Optional[str] = None,
+        conversation_history: Optional[Iterable[Dict[str, str]]] = None,
+        user_role: str = "patient",
+        scan_images: Optional[List[Dict[str, Any]]] = None,
+    ) -> AIResponse:
+        """
+        Process a chat query with optional document context.
+        Adapts response style based on user role.
+        
+        Args:
+            query: User's question
+            document_context: OCR text from linked document
+            conversation_history: Previous messages in conversation (any
+                                  iterable; only the last HISTORY_LIMIT are used)
+            user_role: User's role (patient, doctor, clinician)
+            scan_images: Optional list of dicts with keys
+                         {"data": bytes, "mime_type": str, "filename": str}
+                         for imaging/radiology documents to be analysed
+                         visually by MediX-R1-30B.
+            
+        Returns:
+            AIResponse with content and metadata
+        """
+        start_ns = time.perf_counter_ns()
+        history = _recent_history(conversation_history)
+        
+        # Identical text-only turns are answered from the cache
+        cache_key = None
+        if not scan_images:
+            cache_key = _chat_cache_key(query, document_context, history, user_role)
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                return dataclasses.replace(cached, latency_ms=0)
+        
+        expert_type, system_prompt, messages, has_document = self._prepare_chat(
+            query, document_context, history, user_role, scan_images,
+        )
+        
         try:
             if not self._available:
                 raise AIServiceError("AI service not configured")
@@ -672,7 +997,7 @@ Please explain the relevant medical concepts instead."""
             # Apply safety sanitization (role-aware)
             sanitized_content = self.safety.sanitize_response(result["text"], user_role)
             
-            latency_ms = int((time.time() - start_time) * 1000)
+            latency_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
             
             logger.info(
                 f"AI response: expert={expert_type.value}, "
@@ -683,7 +1008,7 @@ Please explain the relevant medical concepts instead."""
                 settings.HF_MODEL if self.provider == "huggingface" else settings.NVIDIA_MODEL
             )
             
-            return AIResponse(
+            response = AIResponse(
                 content=sanitized_content,
                 expert_used=expert_type.value,
                 model_used=result["model"],
@@ -691,13 +1016,17 @@ Please explain the relevant medical concepts instead."""
                 latency_ms=latency_ms,
                 has_document_context=has_document,
             )
+            # Replies to safety-flagged questions are always regenerated
+            if cache_key is not None and self.safety.check_input(query)["is_safe"]:
+                self._response_cache.set(cache_key, response)
+            return response
             
         except httpx.HTTPStatusError as e:
             logger.error(f"AI API error: {e.response.status_code} - {e.response.text}")
             raise AIServiceError(f"AI service error: {e.response.status_code}")
         except Exception as e:
             logger.error(f"AI service error: {e}")
-            latency_ms = int((time.time() - start_time) * 1000)
+            latency_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
             
             fallback_model = "MediX-R1-8B" if self.provider == "local" else (
                 settings.HF_MODEL if self.provider == "huggingface" else settings.NVIDIA_MODEL
@@ -712,6 +1041,51 @@ Please explain the relevant medical concepts instead."""
                 has_document_context=has_document,
             )
     
+    async def chat_stream(
+        self,
+        query: str,
+        document_context: Optional[str] = None,
+        conversation_history: Optional[Iterable[Dict[str, str]]] = None,
+        user_role: str = "patient",
+        scan_images: Optional[List[Dict[str, Any]]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat response as it is generated.
+        
+        Takes the same arguments as chat() and yields text chunks, suitable
+        for forwarding through a StreamingResponse. Safety checks run on the
+        complete reply once the stream ends; for patients the medical
+        disclaimer is yielded as the last chunk.
+        """
+        start_ns = time.perf_counter_ns()
+        expert_type, system_prompt, messages, has_document = self._prepare_chat(
+            query, document_context, _recent_history(conversation_history), user_role, scan_images,
+        )
+        
+        if not self._available:
+            raise AIServiceError("AI service not configured")
+        
+        parts: List[str] = []
+        usage: Dict[str, Any] = {}
+        try:
+            async for delta in self._stream_completion(messages, system_prompt, usage=usage):
+                parts.append(delta)
+                yield delta
+        except httpx.HTTPStatusError as e:
+            logger.error(f"AI API error: {e.response.status_code}")
+            raise AIServiceError(f"AI service error: {e.response.status_code}")
+        
+        reply = "".join(parts)
+        sanitized = self.safety.sanitize_response(reply, user_role)
+        if sanitized.startswith(reply) and len(sanitized) > len(reply):
+            yield sanitized[len(reply):]
+        
+        latency_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
+        logger.info(
+            f"AI stream: expert={expert_type.value}, has_doc={has_document}, "
+            f"tokens={usage.get('total_tokens', 0)}, latency={latency_ms}ms"
+        )
+    
     async def analyze_image(
         self,
         image_data: bytes,
@@ -722,16 +1096,13 @@ Please explain the relevant medical concepts instead."""
         Analyze a medical image using the active AI provider's vision model.
         MediX-R1-30B is itself a vision-language model so it handles images natively.
         """
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         
         system_prompt = """You are a medical image analysis assistant.
 NEVER provide diagnosis from images.
 Only describe what you observe and suggest consulting a healthcare professional."""
         
         try:
-            # Encode image to base64
-            image_b64 = base64.b64encode(image_data).decode("utf-8")
-            
             # Multimodal message with image
             messages = [{
                 "role": "user",
@@ -739,7 +1110,7 @@ Only describe what you observe and suggest consulting a healthcare professional.
                     {"type": "text", "text": query},
                     {
                         "type": "image_url",
-                        "image_url": {"url": f"data:{mime_type};base64,{image_b64}"}
+                        "image_url": {"url": _data_url_fragment(image_data, mime_type)}
                     }
                 ]
             }]
@@ -749,7 +1120,7 @@ Only describe what you observe and suggest consulting a healthcare professional.
                     messages, system_prompt, max_tokens=2048
                 )
                 content = self.safety.sanitize_response(result["text"])
-                latency_ms = int((time.time() - start_time) * 1000)
+                latency_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
                 return AIResponse(
                     content=content,
                     expert_used="radiology",
@@ -761,45 +1132,35 @@ Only describe what you observe and suggest consulting a healthcare professional.
                 vision_model = settings.HF_MODEL  # Qwen2.5-VL is a VLM
                 hf_url = f"{settings.HF_INFERENCE_URL}/chat/completions"
                 
-                async with httpx.AsyncClient(timeout=120.0) as client:
-                    response = await client.post(
-                        hf_url,
-                        headers={
-                            "Authorization": f"Bearer {settings.HF_API_KEY}",
-                            "Content-Type": "application/json",
-                        },
-                        json={
-                            "model": vision_model,
-                            "messages": [{"role": "system", "content": system_prompt}] + messages,
-                            "temperature": 0.3,
-                            "max_tokens": 2048,
-                        },
-                    )
-                    response.raise_for_status()
-                    data = response.json()
+                response = await self._client.post(
+                    hf_url,
+                    content=orjson.dumps({
+                        "model": vision_model,
+                        "messages": [{"role": "system", "content": system_prompt}] + messages,
+                        "temperature": 0.3,
+                        "max_tokens": 2048,
+                    }),
+                )
+                response.raise_for_status()
+                data = orjson.loads(response.content)
             else:
                 vision_model = settings.NVIDIA_VISION_MODEL
-                async with httpx.AsyncClient(timeout=90.0) as client:
-                    response = await client.post(
-                        f"{settings.NVIDIA_BASE_URL}/chat/completions",
-                        headers={
-                            "Authorization": f"Bearer {settings.NVIDIA_API_KEY}",
-                            "Content-Type": "application/json",
-                        },
-                        json={
-                            "model": vision_model,
-                            "messages": [{"role": "system", "content": system_prompt}] + messages,
-                            "temperature": 0.3,
-                            "max_tokens": 2048,
-                        },
-                    )
-                    response.raise_for_status()
-                    data = response.json()
+                response = await self._client.post(
+                    f"{settings.NVIDIA_BASE_URL}/chat/completions",
+                    content=orjson.dumps({
+                        "model": vision_model,
+                        "messages": [{"role": "system", "content": system_prompt}] + messages,
+                        "temperature": 0.3,
+                        "max_tokens": 2048,
+                    }),
+                )
+                response.raise_for_status()
+                data = orjson.loads(response.content)
             
             content = self.safety.sanitize_response(
                 data["choices"][0]["message"]["content"]
             )
-            latency_ms = int((time.time() - start_time) * 1000)
+            latency_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
             
             return AIResponse(
                 content=content,
@@ -822,7 +1183,7 @@ Only describe what you observe and suggest consulting a healthcare professional.
                 expert_used="radiology",
                 model_used=vision_model,
                 tokens_used=0,
-                latency_ms=int((time.time() - start_time) * 1000),
+                latency_ms=(time.perf_counter_ns() - start_ns) // 1_000_000,
             )
     
     async def extract_health_data(self, ocr_text: str) -> List[Dict[str, Any]]:
@@ -871,20 +1232,48 @@ Return ONLY valid JSON array, no other text."""
                     messages, extract_sys, temperature=0.1,
                 )
             
-            text = result["text"].strip()
-            
-            # Find JSON array in response
-            start = text.find("[")
-            end = text.rfind("]") + 1
+            # Find JSON array in response (any code fence lies outside it)
+            raw = result["text"].encode()
+            start = raw.find(b"[")
+            end = raw.rfind(b"]") + 1
             if start != -1 and end > start:
-                records = json.loads(text[start:end])
-                return records if isinstance(records, list) else []
+                records = orjson.loads(memoryview(raw)[start:end])
+                if not isinstance(records, list):
+                    return []
+                return _normalize_health_records([r for r in records if isinstance(r, dict)])
             
             return []
             
         except Exception as e:
             logger.error(f"Health data extraction error: {e}")
             return []
+    
+    async def extract_health_data_batch(
+        self,
+        ocr_texts: List[str],
+        concurrency: Optional[int] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Extract health data from several documents concurrently.
+        
+        At most `concurrency` (default settings.AI_BATCH_CONCURRENCY)
+        extraction calls are in flight at once; they share the pooled
+        client. Results are returned in input order, with an empty list for
+        any document whose extraction failed.
+        """
+        if len(ocr_texts) == 1:
+            return [await self.extract_health_data(ocr_texts[0])]
+        
+        semaphore = asyncio.Semaphore(concurrency or settings.AI_BATCH_CONCURRENCY)
+        
+        async def extract_one(ocr_text: str) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self.extract_health_data(ocr_text)
+        
+        results = await asyncio.gather(
+            *(extract_one(text) for text in ocr_texts), return_exceptions=True,
+        )
+        return [[] if isinstance(r, BaseException) else r for r in results]
 
 
 # Global service instance
@@ -14,7 +14,7 @@ from typing import Optional
 import httpx
 
 from app.config import settings
-from app.services.storage import download_from_storage
+from app.services.storage import download_from_storage_async
 
 logger = logging.getLogger(__name__)
 
@@ -193,14 +193,14 @@ class AnalysisService:
     ) -> Optional[str]:
         """Analyze a medical scan image via the vision model."""
         try:
-            image_bytes = download_from_storage(storage_path)
+            image_bytes = await download_from_storage_async(storage_path)
             if not image_bytes:
                 logger.error(
                     f"Could not download scan image for {doc_id}"
                 )
                 return None
 
-            b64_image = base64.b64encode(image_bytes).decode("utf-8")
+            b64_image = base64.b64encode(image_bytes).decode("ascii")
 
             ext = (
                 filename.rsplit(".", 1)[-1].lower()
@@ -1,6 +1,10 @@
 """Firebase Admin SDK initialization and Firestore client."""
+import asyncio
+import functools
 import logging
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
 
 import firebase_admin
 from firebase_admin import credentials, firestore
@@ -12,48 +16,120 @@ logger = logging.getLogger(__name__)
 # Global Firestore client
 db: Optional[firestore.Client] = None
 
+# Serializes first-time initialization across worker threads
+_init_lock = threading.Lock()
+
+# Dedicated pool for blocking Firestore RPCs, keeps async routes off the event loop
+_FS_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="firestore")
+
+T = TypeVar("T")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_certificate() -> credentials.Certificate:
+    """
+    Build the service-account credential from environment settings.
+    
+    Cached so the PEM private key is only parsed once per process.
+    """
+    cred_dict = {
+        "type": "service_account",
+        "project_id": settings.FIREBASE_PROJECT_ID,
+        "private_key_id": settings.FIREBASE_PRIVATE_KEY_ID,
+        "private_key": settings.FIREBASE_PRIVATE_KEY.replace("\\n", "\n"),
+        "client_email": settings.FIREBASE_CLIENT_EMAIL,
+        "client_id": settings.FIREBASE_CLIENT_ID,
+        "auth_uri": settings.FIREBASE_AUTH_URI,
+        "token_uri": settings.FIREBASE_TOKEN_URI,
+        "auth_provider_x509_cert_url": settings.FIREBASE_AUTH_PROVIDER_CERT_URL,
+        "client_x509_cert_url": settings.FIREBASE_CLIENT_CERT_URL,
+    }
+    return credentials.Certificate(cred_dict)
+
 
 def initialize_firebase() -> firestore.Client:
     """
     Initialize Firebase Admin SDK and return Firestore client.
     
-    This should be called once during application startup.
+    This should be called once during application startup. Safe to call
+    concurrently; only the first caller initializes the app.
     """
     global db
     
     if db is not None:
         return db
     
-    try:
-        # Check if already initialized
-        firebase_admin.get_app()
-        logger.info("Firebase already initialized")
-    except ValueError:
-        # Build credentials from environment
-        cred_dict = {
-            "type": "service_account",
-            "project_id": settings.FIREBASE_PROJECT_ID,
-            "private_key_id": settings.FIREBASE_PRIVATE_KEY_ID,
-            "private_key": settings.FIREBASE_PRIVATE_KEY.replace("\\n", "\n"),
-            "client_email": settings.FIREBASE_CLIENT_EMAIL,
-            "client_id": settings.FIREBASE_CLIENT_ID,
-            "auth_uri": settings.FIREBASE_AUTH_URI,
-            "token_uri": settings.FIREBASE_TOKEN_URI,
-            "auth_provider_x509_cert_url": settings.FIREBASE_AUTH_PROVIDER_CERT_URL,
-            "client_x509_cert_url": settings.FIREBASE_CLIENT_CERT_URL,
-        }
+    with _init_lock:
+        if db is not None:
+            return db
         
-        cred = credentials.Certificate(cred_dict)
-        firebase_admin.initialize_app(cred)
-        logger.info(f"Firebase initialized for project: {settings.FIREBASE_PROJECT_ID}")
-    
-    db = firestore.client()
+        try:
+            # Check if already initialized
+            firebase_admin.get_app()
+            logger.info("Firebase already initialized")
+        except ValueError:
+            firebase_admin.initialize_app(_get_certificate())
+            logger.info(f"Firebase initialized for project: {settings.FIREBASE_PROJECT_ID}")
+        
+        db = firestore.client()
     return db
 
 
 def get_db() -> firestore.Client:
     """Get the Firestore client, initializing if needed."""
-    global db
     if db is None:
-        db = initialize_firebase()
+        return initialize_firebase()
     return db
+
+
+async def fs_run(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking Firestore call on the Firestore thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_FS_POOL, functools.partial(func, *args, **kwargs))
+
+
+async def fs_get(ref) -> firestore.DocumentSnapshot:
+    """Fetch a document snapshot without blocking the event loop."""
+    return await fs_run(ref.get)
+
+
+async def fs_stream(query) -> List[firestore.DocumentSnapshot]:
+    """Run a query to completion without blocking the event loop."""
+    return await fs_run(lambda: list(query.stream()))
+
+
+def doctor_patient_link_id(doctor_id: str, patient_id: str) -> str:
+    """Deterministic `doctor_patients` document ID for a doctor/patient pair."""
+    return f"{doctor_id}_{patient_id}"
+
+
+def get_doctor_patient_link(
+    db: firestore.Client,
+    doctor_id: str,
+    patient_id: str,
+    statuses: Iterable[str] = ("active",),
+) -> Optional[Dict[str, Any]]:
+    """
+    Fetch the doctor/patient link with a single key lookup.
+
+    Returns the link data if its status is one of `statuses`, else None.
+    Links created before deterministic IDs are keyed by a random UUID, so
+    fall back to the field query only when the keyed document is missing.
+    """
+    statuses = list(statuses)
+    link = db.collection("doctor_patients").document(
+        doctor_patient_link_id(doctor_id, patient_id)
+    ).get()
+    if link.exists:
+        data = link.to_dict()
+        return data if data.get("status") in statuses else None
+
+    legacy = db.collection("doctor_patients") \
+        .where("doctor_id", "==", doctor_id) \
+        .where("patient_id", "==", patient_id) \
+        .where("status", "in", statuses) \
+        .limit(1) \
+        .stream()
+    for l in legacy:
+        return l.to_dict()
+    return None
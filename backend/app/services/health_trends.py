@@ -0,0 +1,172 @@
+"""
+Monthly health-record buckets backing the trends view.
+
+Each `health_record_buckets/{user_id}_{series}_{YYYY-MM}` document holds
+the count, sum, min, max and abnormal count of one series' numeric values
+in one month, where a series is one test (record type, name and unit) so
+unrelated labs are never averaged together. Buckets are updated whenever
+health records are written, so the trends endpoint reads O(months)
+documents instead of streaming every record.
+"""
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_COLLECTION = "health_record_buckets"
+
+# Firestore batches are limited to 500 writes
+_BATCH_LIMIT = 500
+
+# Bumped whenever the bucket key changes, so existing users are rebuilt
+BUCKETS_VERSION = 2
+
+SeriesKey = Tuple[str, str, str]
+
+
+def series_key(record: Dict[str, Any]) -> SeriesKey:
+    """(record_type, name, unit) identifying one test's readings."""
+    return (
+        record.get("record_type", "other"),
+        record.get("name", "Unknown"),
+        record.get("value_unit", ""),
+    )
+
+
+def bucket_id(user_id: str, series: SeriesKey, month: str) -> str:
+    """Deterministic bucket document ID (test names may contain '/')."""
+    digest = hashlib.blake2b("\0".join(series).encode(), digest_size=8).hexdigest()
+    return f"{user_id}_{digest}_{month}"
+
+
+def _numeric(value: Any) -> Optional[float]:
+    """Coerce an extracted value to float, or None if it isn't numeric."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _aggregate(
+    records: Iterable[Dict[str, Any]],
+) -> Dict[Tuple[SeriesKey, str], Dict[str, Any]]:
+    """Reduce health records to per-(series, month) statistics."""
+    buckets: Dict[Tuple[SeriesKey, str], Dict[str, Any]] = {}
+    for record in records:
+        value = _numeric(record.get("value_numeric"))
+        month = (record.get("effective_date") or "")[:7]
+        if value is None or len(month) != 7:
+            continue
+
+        series = series_key(record)
+        bucket = buckets.get((series, month))
+        if bucket is None:
+            record_type, name, unit = series
+            buckets[(series, month)] = {
+                "record_type": record_type,
+                "name": name,
+                "month": month,
+                "unit": unit,
+                "count": 1,
+                "sum": value,
+                "min": value,
+                "max": value,
+                "abnormal_count": 1 if record.get("is_abnormal") else 0,
+            }
+        else:
+            bucket["count"] += 1
+            bucket["sum"] += value
+            bucket["min"] = min(bucket["min"], value)
+            bucket["max"] = max(bucket["max"], value)
+            if record.get("is_abnormal"):
+                bucket["abnormal_count"] += 1
+    return buckets
+
+
+def _commit_batched(db, writes: Iterable[Tuple[Any, Optional[Dict[str, Any]]]]) -> None:
+    """Apply (ref, data) writes in batches; data=None deletes the document."""
+    batch = db.batch()
+    pending = 0
+    for ref, data in writes:
+        if data is None:
+            batch.delete(ref)
+        else:
+            batch.set(ref, data, merge=True)
+        pending += 1
+        if pending == _BATCH_LIMIT:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+
+def add_to_buckets(db, user_id: str, records: Iterable[Dict[str, Any]]) -> None:
+    """
+    Fold newly written health records into their monthly buckets.
+
+    Uses server-side Increment/Minimum/Maximum transforms, so concurrent
+    writers for the same bucket don't lose updates.
+    """
+    _commit_batched(db, (
+        (
+            db.collection(BUCKETS_COLLECTION).document(bucket_id(user_id, series, month)),
+            {
+                "user_id": user_id,
+                "record_type": stats["record_type"],
+                "name": stats["name"],
+                "month": month,
+                "unit": stats["unit"],
+                "count": firestore.Increment(stats["count"]),
+                "sum": firestore.Increment(stats["sum"]),
+                "min": firestore.Minimum(stats["min"]),
+                "max": firestore.Maximum(stats["max"]),
+                "abnormal_count": firestore.Increment(stats["abnormal_count"]),
+            },
+        )
+        for (series, month), stats in _aggregate(records).items()
+    ))
+
+
+def rebuild_buckets(
+    db,
+    user_id: str,
+    records: Optional[Iterable[Dict[str, Any]]] = None,
+) -> None:
+    """
+    Recompute all of a user's buckets from their health records.
+
+    Needed after records are deleted (min/max can't be decremented) and
+    to backfill users whose records predate bucketing. Pass `records` when
+    the caller already holds the user's full record set.
+    """
+    if records is None:
+        records = (
+            doc.to_dict() for doc in
+            db.collection("health_records").where("user_id", "==", user_id).stream()
+        )
+
+    fresh = {
+        bucket_id(user_id, series, month): stats
+        for (series, month), stats in _aggregate(records).items()
+    }
+    stale = [
+        doc.reference for doc in
+        db.collection(BUCKETS_COLLECTION).where("user_id", "==", user_id).stream()
+        if doc.id not in fresh
+    ]
+
+    _commit_batched(db, [(ref, None) for ref in stale] + [
+        (db.collection(BUCKETS_COLLECTION).document(doc_id), {"user_id": user_id, **stats})
+        for doc_id, stats in fresh.items()
+    ])
+
+    db.collection("users").document(user_id).set(
+        {"health_buckets_version": BUCKETS_VERSION}, merge=True,
+    )
+    logger.info(f"Rebuilt {len(fresh)} health trend buckets for user {user_id}")
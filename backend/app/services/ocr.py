@@ -2,20 +2,42 @@
 OCR Service using MediX-R1 (llama-server) for document text extraction.
 
 All OCR is handled by the MediX vision model running on llama-server.
-PDFs with native text use PyPDF2 extraction (no model needed).
-Images and scanned PDFs are sent to MediX vision for OCR.
+PDFs with native text use PyMuPDF extraction (no model needed), falling
+back to PyPDF2 when PyMuPDF isn't installed.
+Images are sent to MediX vision for OCR. Scanned PDF pages are first read
+with local Tesseract when available; only low-confidence pages go to MediX.
 """
+import asyncio
 import io
 import base64
 import logging
+import multiprocessing
+import os
+import re
 import time
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional, Tuple
 
 import httpx
+import numpy as np
+from blake3 import blake3
 from PIL import Image
 from PyPDF2 import PdfReader
 
 from app.config import settings
+from app.services.firebase import fs_get, fs_run, get_db
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
 
 logger = logging.getLogger(__name__)
 
@@ -38,13 +60,150 @@ VISION_OCR_PROMPT = (
     "Output only the extracted text, nothing else."
 )
 
+# Prompt for several pages in one request; the model labels each page so
+# the response can be split back apart. Kept free of per-request values so
+# every batch shares the same prompt prefix.
+VISION_OCR_PROMPT_BATCH = (
+    "You are given several document page images, in order. For each page, "
+    "first write a line '--- Page K ---', where K is the page's position "
+    "(1 for the first image, 2 for the second, and so on), then extract "
+    "ALL text on that page exactly as it appears, preserving the layout, "
+    "tables, numbers, and formatting. Include every detail — headers, "
+    "values, units, dates, names, and notes. "
+    "Output only the page markers and the extracted text, nothing else."
+)
+_PAGE_MARKER_RE = re.compile(r"^-{3}\s*Page\s+(\d+)\s*-{3}\s*$", re.MULTILINE)
+
+
+# Vision OCR results are cached in Firestore by file content. Bump the
+# version whenever the model or the OCR prompts change. `expires_at` is a
+# Timestamp with a TTL policy on it (firestore.indexes.json), so expired
+# entries are purged by Firestore rather than just ignored on read.
+OCR_CACHE_COLLECTION = "ocr_cache"
+OCR_CACHE_VERSION = "medix-r1-8b:v3"
+OCR_CACHE_TTL = timedelta(days=30)
+
+# Only OCR output is worth caching; native PDF text is cheap to redo.
+# Partial or truncated PDF results get their own method names and are
+# never cached, so a transient model error isn't replayed for 30 days.
+_CACHEABLE_METHODS = frozenset({"medix_vision", "medix_vision_pdf", "tesseract_pdf"})
+
+
+# ── Image utilities ──────────────────────────────────────────
+# Plain functions so they can run in the render process pool.
+
+def _resize_if_needed(image: Image.Image, max_dim: int) -> Image.Image:
+    """Resize image if either dimension exceeds max_dim."""
+    w, h = image.size
+    if max(w, h) <= max_dim:
+        return image
+
+    ratio = max_dim / max(w, h)
+    new_w = int(w * ratio)
+    new_h = int(h * ratio)
+    return image.resize((new_w, new_h), Image.LANCZOS)
+
+
+def _encode_image(
+    file_data: bytes, max_dim: int
+) -> Tuple[bytes, str, Tuple[int, int]]:
+    """
+    Decode, downscale and re-encode an uploaded image for MediX.
+
+    Returns the encoded bytes, their MIME type and the final pixel size.
+    """
+    image = Image.open(io.BytesIO(file_data))
+    # Only PNGs with real transparency stay PNG; everything else
+    # goes over the wire as JPEG, which is far smaller for scans.
+    keep_png = image.format == "PNG" and (
+        image.mode in ("RGBA", "LA", "PA")
+        or "transparency" in image.info
+    )
+    if image.format == "JPEG" and max(image.size) > max_dim:
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale (never below
+        # max_dim), so oversized photos are never decoded at full size
+        image.draft("RGB", (max_dim, max_dim))
+    if not keep_png and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    original_size = image.size
+    image = _resize_if_needed(image, max_dim)
+
+    if keep_png and image.size == original_size:
+        return file_data, "image/png", image.size
+
+    buf = io.BytesIO()
+    if keep_png:
+        image.save(buf, format="PNG")
+        return buf.getvalue(), "image/png", image.size
+    image.save(buf, format="JPEG", quality=85, optimize=False)
+    return buf.getvalue(), "image/jpeg", image.size
+
+
+# A rendered page counts as blank when its pixels barely vary or almost
+# none of them carry ink. Both thresholds are deliberately tight: a page
+# holding a single short line of text is only ~0.04% ink with a pixel
+# stddev around 4, and must still be OCR'd.
+BLANK_PAGE_MAX_STD = 2.0
+BLANK_PAGE_MIN_INK = 0.00005
+_INK_LEVEL = 200  # channel values below this count as ink
+
+
+def _is_blank(pix) -> bool:
+    """Cheap content-density check on a rendered page's raw samples."""
+    samples = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    if samples.size == 0:
+        return True
+    ink = np.count_nonzero(samples < _INK_LEVEL) / samples.size
+    return ink < BLANK_PAGE_MIN_INK or float(samples.std()) < BLANK_PAGE_MAX_STD
+
+
+def _render_pdf_pages(
+    file_data: bytes, start: int, stop: int, max_dim: int
+) -> List[Tuple[Optional[bytes], Tuple[int, int]]]:
+    """
+    Rasterize pages [start, stop) straight to RGB JPEGs.
+
+    Returns each page's JPEG bytes (None for blank pages, which are never
+    encoded or sent for OCR) and pixel size. The DPI is chosen per
+    page so it already fits max_dim, so rendered pages never go through
+    PIL. Each worker process opens its own copy of the document (PyMuPDF
+    handles can't be shared across processes) and renders a whole run of
+    pages from it, rather than re-parsing the PDF for every page.
+    """
+    rendered = []
+    with fitz.open(stream=file_data, filetype="pdf") as doc:
+        for page in doc.pages(start, stop):
+            longest = max(page.rect.width, page.rect.height) or 1
+            dpi = min(200, int(max_dim * 72 / longest))
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB)
+            img_bytes = None if _is_blank(pix) else pix.tobytes("jpeg", jpg_quality=85)
+            rendered.append((img_bytes, (pix.width, pix.height)))
+            del pix  # free the samples before the next page allocates
+    return rendered
+
+
+def _pypdf2_extract_pages(file_data: bytes, start: int, stop: int) -> List[str]:
+    """
+    Native text of pages [start, stop) via PyPDF2.
+
+    PyPDF2 is pure Python and its reader isn't safe to share between
+    threads, so pages are split across worker processes, each with its
+    own reader.
+    """
+    reader = PdfReader(io.BytesIO(file_data))
+    return [
+        reader.pages[i].extract_text() or ""
+        for i in range(start, min(stop, len(reader.pages)))
+    ]
+
 
 class OCRService:
     """
     Document text extraction using MediX-R1 via llama-server.
 
     - Image files → MediX vision OCR (llama-server /v1/chat/completions)
-    - PDF files → PyPDF2 native text extraction; scanned pages → MediX vision
+    - PDF files → PyMuPDF native text extraction; scanned pages → MediX vision
     """
 
     SUPPORTED_IMAGES = {
@@ -55,33 +214,87 @@ class OCRService:
 
     MAX_IMAGE_DIM = 2048
 
+    # Decode budget per image scales with its area: a small slip can't
+    # hold a full page of text, so don't let the model run on that long.
+    VISION_MIN_TOKENS = 256
+    VISION_MAX_TOKENS = 4096
+    PIXELS_PER_TOKEN = 2500
+    # MediX is a reasoning model; reasoning is switched off for OCR, but
+    # every budget keeps this much headroom in case the template ignores it
+    VISION_REASONING_TOKENS = 512
+
     def __init__(self):
         """Initialize OCR service (uses llama-server, no local model load)."""
+        # Bounds concurrent page OCR calls to the vision model
+        self._sem = asyncio.Semaphore(settings.OCR_CONCURRENCY)
+        # Image decode/resize/encode and PDF rasterization are CPU-bound;
+        # they run in worker processes so the event loop stays free.
+        # Created on first use so importing the module doesn't fork.
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # One pooled HTTP/2 client for all vision calls, so pages reuse
+        # connections instead of paying a handshake each time
+        self._client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+        )
         logger.info(
             f"MediX OCR service ready — using llama-server at "
             f"{settings.LLAMA_SERVER_URL}"
         )
 
+    async def aclose(self) -> None:
+        """Close the shared HTTP client. Called on application shutdown."""
+        await self._client.aclose()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _render_pool(self) -> ProcessPoolExecutor:
+        """
+        Return the CPU worker pool, starting it on first use.
+
+        Workers are not forked from this process: by then it is running
+        gRPC and thread-pool threads whose locks a fork child would inherit.
+        """
+        if self._pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            method = "forkserver" if "forkserver" in methods else "spawn"
+            self._pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context(method),
+            )
+        return self._pool
+
     async def extract_text(
         self,
         file_data: bytes,
         mime_type: str,
+        content_key: Optional[str] = None,
     ) -> OCRResult:
         """
         Extract text from a document.
 
+        Vision OCR results are cached by file content, so re-uploads of a
+        file skip the model.
+
         Args:
             file_data: Raw file bytes
             mime_type: MIME type of the file
+            content_key: BLAKE3 hex digest of file_data, if already known
 
         Returns:
             OCRResult with extracted text and confidence
         """
+        cache_id = self._cache_id(content_key or blake3(file_data).hexdigest())
         try:
             if mime_type in self.SUPPORTED_IMAGES:
-                return await self._extract_from_image(file_data, mime_type)
+                return await self._cached(
+                    cache_id,
+                    lambda: self._extract_from_image(file_data, mime_type),
+                )
             elif mime_type in self.SUPPORTED_PDF:
-                return await self._extract_from_pdf(file_data)
+                # Looks up the cache itself, only once native text fails
+                return await self._extract_from_pdf(file_data, cache_id)
             else:
                 logger.warning(f"Unsupported MIME type for OCR: {mime_type}")
                 return OCRResult(text="", confidence=0.0, method="unsupported")
@@ -89,118 +302,349 @@ class OCRService:
             logger.error(f"OCR extraction failed: {e}")
             return OCRResult(text="", confidence=0.0, method="error")
 
+    # ── Result cache (Firestore) ─────────────────────────────
+
+    @staticmethod
+    def _cache_id(content_key: str) -> str:
+        """Cache document ID for a file's BLAKE3 content key."""
+        return f"{content_key}:{OCR_CACHE_VERSION}"
+
+    async def _cached(
+        self, cache_id: Optional[str], extract: Callable[[], Awaitable[OCRResult]]
+    ) -> OCRResult:
+        """Serve an OCR result from the cache, else run `extract` and cache it."""
+        if cache_id is None:
+            return await extract()
+
+        cached = await self._get_cached(cache_id)
+        if cached is not None:
+            logger.info(f"OCR cache hit ({cached.method})")
+            return cached
+
+        result = await extract()
+        if result.text and result.method in _CACHEABLE_METHODS:
+            await self._set_cached(cache_id, result)
+        return result
+
+    async def evict_cached(self, content_key: str) -> None:
+        """Drop a file's cached OCR text, e.g. when its document is deleted."""
+        try:
+            await fs_run(
+                get_db().collection(OCR_CACHE_COLLECTION)
+                .document(self._cache_id(content_key)).delete
+            )
+        except Exception as e:
+            logger.warning(f"OCR cache delete failed: {e}")
+
+    async def _get_cached(self, cache_id: str) -> Optional[OCRResult]:
+        """Return a cached, unexpired OCR result, or None."""
+        try:
+            snap = await fs_get(get_db().collection(OCR_CACHE_COLLECTION).document(cache_id))
+            if not snap.exists:
+                return None
+            data = snap.to_dict()
+            # TTL deletion can lag by a day or so; entries written before
+            # expires_at became a Timestamp count as expired
+            expires_at = data.get("expires_at")
+            if not isinstance(expires_at, datetime) or expires_at <= datetime.now(timezone.utc):
+                return None
+            return OCRResult(**data["result"])
+        except Exception as e:
+            logger.warning(f"OCR cache read failed: {e}")
+            return None
+
+    async def _set_cached(self, cache_id: str, result: OCRResult) -> None:
+        """Store an OCR result; cache failures never fail the extraction."""
+        try:
+            await fs_run(
+                get_db().collection(OCR_CACHE_COLLECTION).document(cache_id).set,
+                {
+                    "result": asdict(result),
+                    "expires_at": datetime.now(timezone.utc) + OCR_CACHE_TTL,
+                },
+            )
+        except Exception as e:
+            logger.warning(f"OCR cache write failed: {e}")
+
     # ── Image OCR via MediX vision (llama-server) ────────────
 
     async def _extract_from_image(
         self, file_data: bytes, mime_type: str = "image/jpeg"
     ) -> OCRResult:
         """Extract text from an image using MediX vision via llama-server."""
-        start = time.time()
-
         try:
-            image = Image.open(io.BytesIO(file_data))
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-
-            image = self._resize_if_needed(image)
-
-            # Re-encode for llama-server
-            buf = io.BytesIO()
-            fmt = "PNG" if mime_type == "image/png" else "JPEG"
-            image.save(buf, format=fmt)
-            b64_image = base64.b64encode(buf.getvalue()).decode("utf-8")
-            actual_mime = f"image/{fmt.lower()}"
+            # Image.open only parses the header, so this peek is cheap.
+            # JPEGs and PNGs that already fit go to MediX untouched.
+            with Image.open(io.BytesIO(file_data)) as image:
+                fmt, size = image.format, image.size
+            if fmt in ("JPEG", "PNG") and max(size) <= self.MAX_IMAGE_DIM:
+                return await self._vision_ocr(
+                    file_data, f"image/{fmt.lower()}", self._max_tokens_for(size)
+                )
 
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{actual_mime};base64,{b64_image}",
-                            },
-                        },
-                        {"type": "text", "text": VISION_OCR_PROMPT},
-                    ],
-                }
-            ]
+            loop = asyncio.get_running_loop()
+            encoded, encoded_mime, size = await loop.run_in_executor(
+                self._render_pool(), _encode_image, file_data, self.MAX_IMAGE_DIM
+            )
+        except Exception as e:
+            logger.error(f"MediX OCR inference failed: {e}")
+            return OCRResult(text="", confidence=0.0, method="error")
 
-            url = f"{settings.LLAMA_SERVER_URL}/v1/chat/completions"
-            payload = {
-                "messages": messages,
-                "max_tokens": 4096,
-                "temperature": 0.1,
-            }
-
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                resp = await client.post(url, json=payload)
-                if resp.status_code != 200:
-                    logger.error(
-                        f"MediX OCR error: {resp.status_code} "
-                        f"{resp.text[:200]}"
-                    )
-                    return OCRResult(
-                        text="", confidence=0.0, method="error"
-                    )
+        return await self._vision_ocr(
+            encoded, encoded_mime, self._max_tokens_for(size)
+        )
 
-                data = resp.json()
-                text = (
-                    data.get("choices", [{}])[0]
-                    .get("message", {})
-                    .get("content", "")
-                )
+    @classmethod
+    def _max_tokens_for(cls, size: Tuple[int, int]) -> int:
+        """Decode budget for an image of the given pixel size, plus reasoning headroom."""
+        width, height = size
+        return cls.VISION_REASONING_TOKENS + max(
+            cls.VISION_MIN_TOKENS,
+            min(cls.VISION_MAX_TOKENS, width * height // cls.PIXELS_PER_TOKEN),
+        )
 
-            # Strip <think>…</think> reasoning tags
-            if "<think>" in text and "</think>" in text:
-                text = text.split("</think>")[-1].strip()
+    async def _vision_ocr(
+        self, image_bytes: bytes, mime_type: str, max_tokens: int = VISION_MAX_TOKENS
+    ) -> OCRResult:
+        """Send already-encoded image bytes to MediX vision."""
+        start = time.time()
 
-            elapsed_ms = int((time.time() - start) * 1000)
-            word_count = len(text.split()) if text else 0
-            confidence = (
-                min(0.95, 0.6 + (word_count / 500) * 0.35)
-                if word_count > 0
-                else 0.0
+        try:
+            b64_image = base64.b64encode(image_bytes).decode("ascii")
+            text = await self._vision_complete(
+                VISION_OCR_PROMPT,
+                [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{b64_image}",
+                        },
+                    },
+                ],
+                max_tokens=max_tokens,
             )
+            if text is None:
+                return OCRResult(text="", confidence=0.0, method="error")
 
+            result = self._vision_result(text)
+            elapsed_ms = int((time.time() - start) * 1000)
             logger.info(
-                f"MediX OCR completed: {word_count} words, "
-                f"confidence={confidence:.0%}, latency={elapsed_ms}ms"
-            )
-
-            return OCRResult(
-                text=text.strip(),
-                confidence=round(confidence, 2),
-                method="medix_vision",
+                f"MediX OCR completed: {len(result.text.split())} words, "
+                f"confidence={result.confidence:.0%}, latency={elapsed_ms}ms"
             )
+            return result
 
         except Exception as e:
             logger.error(f"MediX OCR inference failed: {e}")
             return OCRResult(text="", confidence=0.0, method="error")
 
+    async def _vision_ocr_batch(
+        self, images: list, mime_type: str, max_tokens: list
+    ) -> list:
+        """
+        OCR several page images with a single MediX request.
+
+        `max_tokens` holds each image's decode budget. Returns one OCRResult
+        per image, in order. If the response can't be split back into the
+        expected pages, each image is re-sent on its own.
+        """
+        if len(images) == 1:
+            return [await self._vision_ocr(images[0], mime_type, max_tokens[0])]
+
+        start = time.time()
+        content = []
+        for image_bytes in images:
+            b64_image = base64.b64encode(image_bytes).decode("ascii")
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:{mime_type};base64,{b64_image}"},
+            })
+
+        text = await self._vision_complete(
+            VISION_OCR_PROMPT_BATCH, content, max_tokens=sum(max_tokens)
+        )
+        pages = self._split_pages(text, len(images)) if text else None
+        if pages is None:
+            logger.warning(
+                f"MediX batch OCR returned no usable page markers for "
+                f"{len(images)} pages; retrying one page at a time"
+            )
+            return list(await asyncio.gather(
+                *(
+                    self._vision_ocr(img, mime_type, budget)
+                    for img, budget in zip(images, max_tokens)
+                )
+            ))
+
+        elapsed_ms = int((time.time() - start) * 1000)
+        logger.info(
+            f"MediX batch OCR completed: {len(images)} pages, "
+            f"latency={elapsed_ms}ms"
+        )
+        return [self._vision_result(page) for page in pages]
+
+    async def _vision_complete(
+        self, system_prompt: str, content: list, max_tokens: int
+    ) -> Optional[str]:
+        """
+        POST one vision chat request; None if llama-server rejects it or
+        the reply is cut off (by max_tokens, or mid-reasoning), so a
+        truncated page is reported as an error and never cached.
+
+        The fixed instructions go in the system message, ahead of the
+        images, so llama-server's prompt cache can reuse that prefix
+        across pages and documents.
+        """
+        url = f"{settings.LLAMA_SERVER_URL}/v1/chat/completions"
+        payload = {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": content},
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.1,
+            "cache_prompt": True,
+            "chat_template_kwargs": {"enable_thinking": False},
+        }
+
+        resp = await self._client.post(url, json=payload)
+        if resp.status_code != 200:
+            logger.error(
+                f"MediX OCR error: {resp.status_code} "
+                f"{resp.text[:200]}"
+            )
+            return None
+
+        data = resp.json()
+        choice = data.get("choices", [{}])[0]
+        text = choice.get("message", {}).get("content") or ""
+
+        if choice.get("finish_reason") == "length":
+            logger.warning(f"MediX OCR hit max_tokens={max_tokens}; discarding truncated text")
+            return None
+
+        # Strip <think>…</think> reasoning tags
+        if "<think>" in text:
+            if "</think>" not in text:
+                logger.warning("MediX OCR reply ended inside <think>; discarding it")
+                return None
+            text = text.split("</think>")[-1].strip()
+        return text
+
+    @staticmethod
+    def _split_pages(text: str, count: int) -> Optional[list]:
+        """Split a batch response on '--- Page K ---' markers."""
+        parts = _PAGE_MARKER_RE.split(text)
+        # parts = [preamble, "1", page1, "2", page2, ...]
+        pages = {}
+        for number, page_text in zip(parts[1::2], parts[2::2]):
+            pages[int(number)] = page_text.strip()
+        if sorted(pages) != list(range(1, count + 1)):
+            return None
+        return [pages[k] for k in range(1, count + 1)]
+
+    @staticmethod
+    def _vision_result(text: str) -> OCRResult:
+        """Wrap MediX output with the word-count based confidence."""
+        word_count = len(text.split()) if text else 0
+        confidence = (
+            min(0.95, 0.6 + (word_count / 500) * 0.35)
+            if word_count > 0
+            else 0.0
+        )
+        return OCRResult(
+            text=text.strip(),
+            confidence=round(confidence, 2),
+            method="medix_vision",
+        )
+
     # ── PDF OCR ──────────────────────────────────────────────
 
-    async def _extract_from_pdf(self, file_data: bytes) -> OCRResult:
+    async def _extract_from_pdf(
+        self, file_data: bytes, cache_id: Optional[str] = None
+    ) -> OCRResult:
         """
         Extract text from PDF.
-        1. Try native text extraction via PyPDF2 (fast, no model needed).
-        2. For scanned/image PDFs, render pages and use MediX vision OCR.
+        1. Try native text extraction via PyMuPDF (fast, no model needed).
+        2. For scanned/image PDFs, check the OCR cache (under `cache_id`),
+           then render pages and OCR them.
         """
+        if fitz is None:
+            return await self._extract_from_pdf_pypdf2(file_data)
+
+        try:
+            doc = fitz.open(stream=file_data, filetype="pdf")
+        except Exception as e:
+            logger.error(f"PDF processing failed: {e}")
+            return OCRResult(text="", confidence=0.0, method="error")
+
         try:
-            reader = PdfReader(io.BytesIO(file_data))
-            page_count = len(reader.pages)
+            page_count = len(doc)
 
             # Step 1: Try native text extraction
             text_parts = []
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text and page_text.strip():
+            for page in doc:
+                page_text = page.get_text("text").rstrip()
+                if page_text:
                     text_parts.append(page_text)
+        except Exception as e:
+            logger.error(f"PDF processing failed: {e}")
+            return OCRResult(text="", confidence=0.0, method="error")
+        finally:
+            # Render workers reopen the PDF from bytes, so don't hold this
+            # parse open for the length of the OCR run
+            doc.close()
+
+        if text_parts:
+            full_text = "\n\n".join(text_parts)
+            logger.info(
+                f"PDF native text: {len(full_text)} chars "
+                f"from {page_count} pages"
+            )
+            return OCRResult(
+                text=full_text.strip(),
+                confidence=0.95,
+                page_count=page_count,
+                method="pdf_text_extraction",
+            )
+
+        # Step 2: Scanned PDF → render pages → MediX vision OCR
+        try:
+            return await self._cached(
+                cache_id, lambda: self._ocr_pdf_pages(file_data, page_count)
+            )
+        except Exception as e:
+            logger.error(f"PDF processing failed: {e}")
+            return OCRResult(text="", confidence=0.0, method="error")
+
+    async def _extract_from_pdf_pypdf2(self, file_data: bytes) -> OCRResult:
+        """Native PDF text via PyPDF2, used only when PyMuPDF is missing."""
+        try:
+            page_count = len(PdfReader(io.BytesIO(file_data)).pages)
+
+            # One contiguous run of pages per worker process
+            loop = asyncio.get_running_loop()
+            pool = self._render_pool()
+            run_length = max(1, -(-page_count // (os.cpu_count() or 1)))
+            runs = await asyncio.gather(*(
+                loop.run_in_executor(
+                    pool, _pypdf2_extract_pages, file_data,
+                    start, start + run_length,
+                )
+                for start in range(0, page_count, run_length)
+            ))
+
+            text_parts = [
+                page_text
+                for run in runs
+                for page_text in run
+                if page_text.strip()
+            ]
 
             if text_parts:
                 full_text = "\n\n".join(text_parts)
                 logger.info(
-                    f"PDF native text: {len(full_text)} chars "
+                    f"PDF native text (PyPDF2): {len(full_text)} chars "
                     f"from {page_count} pages"
                 )
                 return OCRResult(
@@ -210,20 +654,6 @@ class OCRService:
                     method="pdf_text_extraction",
                 )
 
-            # Step 2: Scanned PDF → render pages → MediX vision OCR
-            return await self._ocr_pdf_pages(file_data, page_count)
-
-        except Exception as e:
-            logger.error(f"PDF processing failed: {e}")
-            return OCRResult(text="", confidence=0.0, method="error")
-
-    async def _ocr_pdf_pages(
-        self, file_data: bytes, page_count: int
-    ) -> OCRResult:
-        """Render scanned PDF pages and run MediX vision OCR on each."""
-        try:
-            import fitz  # PyMuPDF
-        except ImportError:
             logger.warning(
                 "PyMuPDF (fitz) not installed — cannot OCR scanned PDFs. "
                 "Install with: pip install PyMuPDF"
@@ -233,34 +663,146 @@ class OCRService:
                 page_count=page_count, method="pdf_no_renderer",
             )
 
-        start = time.time()
-        doc = fitz.open(stream=file_data, filetype="pdf")
-
-        text_parts = []
-        max_pages = min(len(doc), 10)
+        except Exception as e:
+            logger.error(f"PDF processing failed: {e}")
+            return OCRResult(text="", confidence=0.0, method="error")
 
-        for i in range(max_pages):
-            page = doc[i]
-            pix = page.get_pixmap(dpi=200)
-            img_bytes = pix.tobytes("png")
+    async def _ocr_pdf_pages(self, file_data: bytes, page_count: int) -> OCRResult:
+        """Render scanned PDF pages and run OCR on each."""
+        start = time.time()
+        max_pages = min(page_count, settings.OCR_MAX_PAGES)
+        loop = asyncio.get_running_loop()
+
+        # Pipeline: pages are split into one contiguous run per worker
+        # process and rendered in parallel; the producer hands them to OCR
+        # in page order as each run finishes, so early pages are being
+        # OCR'd while later ones still render.
+        pool = self._render_pool()
+        run_length = max(1, -(-max_pages // (os.cpu_count() or 1)))
+        renders = [
+            loop.run_in_executor(
+                pool, _render_pdf_pages, file_data,
+                start, min(start + run_length, max_pages), self.MAX_IMAGE_DIM,
+            )
+            for start in range(0, max_pages, run_length)
+        ]
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2)
 
+        async def produce() -> None:
             try:
-                result = await self._extract_from_image(
-                    img_bytes, "image/png"
-                )
-                if result.text:
-                    text_parts.append(
-                        f"--- Page {i + 1} ---\n{result.text}"
+                for render in renders:
+                    for rendered in await render:
+                        await queue.put(rendered)
+            finally:
+                await queue.put(None)
+
+        # Pages Tesseract can't read are sent to MediX OCR_BATCH_SIZE at a
+        # time, one request per batch. The token budget is charged strictly
+        # in page order: a page is only budgeted (and possibly sent) once
+        # every earlier page has been settled, so the cutoff is always the
+        # first page in document order that doesn't fit. `processed` drops
+        # to that page and nothing from there on is OCR'd or returned.
+        results: list = [None] * max_pages
+        settled = [False] * max_pages  # read locally, or waiting for MediX
+        waiting: dict = {}  # page index -> (img_bytes, size), not yet budgeted
+        ready: list = []  # budgeted pages not yet sent
+        vision_tasks = []
+        budgeted = 0  # pages [0, budgeted) have been charged to the budget
+        tokens_reserved = 0
+        sent_to_vision = 0
+        processed = max_pages
+
+        async def ocr_batch(batch: list) -> None:
+            async with self._sem:
+                try:
+                    batch_results = await self._vision_ocr_batch(
+                        [img for _, img, _ in batch],
+                        "image/jpeg",
+                        [self._max_tokens_for(size) for _, _, size in batch],
                     )
+                except Exception as e:
+                    batch_results = [e] * len(batch)
+            for (i, _, _), result in zip(batch, batch_results):
+                results[i] = result
+
+        def settle(i: Optional[int], final: bool = False) -> None:
+            nonlocal budgeted, tokens_reserved, sent_to_vision, processed
+            if i is not None:
+                settled[i] = True
+            while budgeted < processed and settled[budgeted]:
+                if budgeted in waiting:
+                    img_bytes, size = waiting.pop(budgeted)
+                    cost = self._max_tokens_for(size)
+                    if tokens_reserved + cost > settings.OCR_MAX_TOKEN_BUDGET:
+                        processed = budgeted
+                        break
+                    tokens_reserved += cost
+                    ready.append((budgeted, img_bytes, size))
+                budgeted += 1
+            while len(ready) >= settings.OCR_BATCH_SIZE or (final and ready):
+                batch = ready[:settings.OCR_BATCH_SIZE]
+                del ready[:settings.OCR_BATCH_SIZE]
+                sent_to_vision += len(batch)
+                vision_tasks.append(asyncio.create_task(ocr_batch(batch)))
+
+        async def ocr_page(i: int, img_bytes: bytes, size: Tuple[int, int]) -> None:
+            try:
+                result = await self._extract_with_tesseract(img_bytes)
             except Exception as e:
+                result = e
+            finally:
+                self._sem.release()
+            if result is None:
+                waiting[i] = (img_bytes, size)
+            else:
+                results[i] = result
+            settle(i)
+
+        render_task = asyncio.create_task(produce())
+        tasks = []
+        try:
+            page_idx = 0
+            while (rendered := await queue.get()) is not None:
+                img_bytes, size = rendered
+                # Past the token budget the remaining renders are drained
+                # without being OCR'd
+                if page_idx < processed:
+                    if img_bytes is None:
+                        results[page_idx] = OCRResult(
+                            text="[blank page]", confidence=1.0, method="blank"
+                        )
+                        settle(page_idx)
+                    else:
+                        await self._sem.acquire()
+                        tasks.append(asyncio.create_task(
+                            ocr_page(page_idx, img_bytes, size)
+                        ))
+                page_idx += 1
+            await render_task
+            await asyncio.gather(*tasks)
+            settle(None, final=True)
+            await asyncio.gather(*vision_tasks)
+        finally:
+            # Only does anything if rendering failed part-way
+            for task in renders + tasks + vision_tasks:
+                task.cancel()
+
+        text_parts = []
+        failed = False
+        for i, result in enumerate(results[:processed]):
+            if isinstance(result, BaseException) or result.method == "error":
+                failed = True
+            if isinstance(result, BaseException):
                 logger.warning(
-                    f"MediX OCR failed for PDF page {i + 1}: {e}"
+                    f"MediX OCR failed for PDF page {i + 1}: {result}"
                 )
                 text_parts.append(
                     f"--- Page {i + 1} ---\n[OCR failed for this page]"
                 )
-
-        doc.close()
+            elif result.text:
+                text_parts.append(
+                    f"--- Page {i + 1} ---\n{result.text}"
+                )
 
         full_text = "\n\n".join(text_parts)
         elapsed_ms = int((time.time() - start) * 1000)
@@ -271,30 +813,73 @@ class OCRService:
             else 0.0
         )
 
+        method = "medix_vision_pdf" if sent_to_vision else "tesseract_pdf"
+        if failed:
+            # Some pages are missing or marked failed; not cacheable
+            method += "_partial"
+        if processed < page_count:
+            # Not cacheable: a larger page or token budget would read more
+            method += "_truncated"
+            logger.warning(
+                f"PDF OCR stopped after {processed} of {page_count} pages "
+                f"(OCR_MAX_PAGES={settings.OCR_MAX_PAGES}, "
+                f"{tokens_reserved} vision tokens reserved)"
+            )
         logger.info(
-            f"PDF MediX OCR: {max_pages} pages, {word_count} words, "
+            f"PDF OCR ({method}): {processed} pages, {word_count} words, "
             f"confidence={confidence:.0%}, latency={elapsed_ms}ms"
         )
 
         return OCRResult(
             text=full_text.strip(),
             confidence=round(confidence, 2),
-            page_count=page_count,
-            method="medix_vision_pdf",
+            page_count=processed,
+            method=method,
         )
 
-    # ── Image utilities ──────────────────────────────────────
+    async def _extract_with_tesseract(self, img_bytes: bytes) -> Optional[OCRResult]:
+        """
+        Read a rendered page with local Tesseract.
 
-    def _resize_if_needed(self, image: Image.Image) -> Image.Image:
-        """Resize image if either dimension exceeds MAX_IMAGE_DIM."""
-        w, h = image.size
-        if max(w, h) <= self.MAX_IMAGE_DIM:
-            return image
+        Returns None (escalate to MediX vision) when Tesseract is disabled or
+        unavailable, or when the page yields too few words or a mean word
+        confidence below OCR_TESSERACT_MIN_CONFIDENCE.
+        """
+        if pytesseract is None or not settings.OCR_TESSERACT_ENABLED:
+            return None
 
-        ratio = self.MAX_IMAGE_DIM / max(w, h)
-        new_w = int(w * ratio)
-        new_h = int(h * ratio)
-        return image.resize((new_w, new_h), Image.LANCZOS)
+        try:
+            data = await asyncio.to_thread(
+                pytesseract.image_to_data,
+                Image.open(io.BytesIO(img_bytes)),
+                output_type=pytesseract.Output.DICT,
+            )
+        except Exception as e:
+            logger.warning(f"Tesseract OCR failed, escalating to MediX: {e}")
+            return None
+
+        # Rebuild lines from word boxes, skipping non-word entries (conf -1)
+        lines: dict = {}
+        confidences = []
+        for i, word in enumerate(data["text"]):
+            conf = float(data["conf"][i])
+            if conf < 0 or not word.strip():
+                continue
+            confidences.append(conf)
+            line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(line_key, []).append(word)
+
+        if len(confidences) < settings.OCR_TESSERACT_MIN_WORDS:
+            return None
+        mean_conf = sum(confidences) / len(confidences)
+        if mean_conf < settings.OCR_TESSERACT_MIN_CONFIDENCE:
+            return None
+
+        return OCRResult(
+            text="\n".join(" ".join(words) for words in lines.values()),
+            confidence=round(mean_conf / 100, 2),
+            method="tesseract",
+        )
 
 
 # Global service instance
@@ -1,9 +1,14 @@
 """Storage service with Firebase Cloud Storage + local filesystem fallback."""
+import asyncio
+import io
 import logging
 import os
+import shutil
+import threading
+import time
 from datetime import timedelta
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Dict, Optional, Tuple, Union
 
 from app.config import settings
 
@@ -17,6 +22,17 @@ _use_local = False
 LOCAL_STORAGE_DIR = Path(settings.UPLOAD_DIR) / "storage"
 LOCAL_STORAGE_DIR.mkdir(parents=True, exist_ok=True)
 
+# Cloud transfers are streamed in chunks of this size (must be a multiple
+# of 256 KiB) rather than as one in-memory request body.
+STORAGE_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Signed URLs are reused for the first half of their lifetime, so each one
+# costs a single signing call per path instead of one per page render while
+# every caller still gets at least half the requested lifetime.
+SIGNED_URL_CACHE_SIZE = 10_000
+_signed_urls: Dict[Tuple[str, int], Tuple[str, float]] = {}
+_signed_urls_lock = threading.Lock()
+
 
 def get_storage_bucket():
     """Get Firebase Storage bucket, falling back to local storage."""
@@ -41,47 +57,77 @@ def get_storage_bucket():
     return _bucket
 
 
-def upload_to_storage(file_data: bytes, storage_path: str, content_type: str) -> str:
+def upload_to_storage(
+    file_data: Union[bytes, BinaryIO], storage_path: str, content_type: str
+) -> str:
     """
-    Upload file bytes to Firebase Cloud Storage or local filesystem.
+    Upload a file to Firebase Cloud Storage or local filesystem.
     
     Args:
-        file_data: Raw file bytes
+        file_data: Raw file bytes, or a binary file object read from its
+            current position (streamed in chunks, never fully buffered)
         storage_path: Path in the bucket (e.g., "documents/user_id/doc_id_filename")
         content_type: MIME type of the file
     
     Returns:
         Storage path reference
     """
+    if isinstance(file_data, (bytes, bytearray, memoryview)):
+        file_obj = io.BytesIO(file_data)
+    else:
+        file_obj = file_data
+    start_pos = file_obj.tell()
+    # A known size lets files up to 8 MB go up as one multipart request;
+    # without it every upload takes the two-request resumable path
+    size = file_obj.seek(0, io.SEEK_END) - start_pos
+    file_obj.seek(start_pos)
+
     bucket = get_storage_bucket()
 
     if bucket is not None:
         try:
             blob = bucket.blob(storage_path)
-            blob.upload_from_string(file_data, content_type=content_type)
-            logger.info(f"Uploaded {len(file_data)} bytes to gs://{bucket.name}/{storage_path}")
+            blob.chunk_size = STORAGE_CHUNK_SIZE
+            blob.upload_from_file(file_obj, size=size, content_type=content_type)
+            logger.info(f"Uploaded {size} bytes to gs://{bucket.name}/{storage_path}")
             return f"gs://{bucket.name}/{storage_path}"
         except Exception as e:
             logger.warning(f"Cloud upload failed ({e}) — falling back to local storage")
+            file_obj.seek(start_pos)
 
     # Local filesystem fallback
-    return _upload_local(file_data, storage_path)
+    return _upload_local(file_obj, storage_path)
 
 
-def _upload_local(file_data: bytes, storage_path: str) -> str:
+def _upload_local(file_obj: BinaryIO, storage_path: str) -> str:
     """Save file to local filesystem."""
     local_path = LOCAL_STORAGE_DIR / storage_path
     local_path.parent.mkdir(parents=True, exist_ok=True)
-    local_path.write_bytes(file_data)
-    logger.info(f"Saved {len(file_data)} bytes locally to {local_path}")
+    with open(local_path, "wb") as out:
+        shutil.copyfileobj(file_obj, out, STORAGE_CHUNK_SIZE)
+        size = out.tell()
+    logger.info(f"Saved {size} bytes locally to {local_path}")
     return f"local://{storage_path}"
 
 
+def _strip_gs(storage_path: str) -> str:
+    """Object path inside the bucket for a gs://bucket/... URI."""
+    if not storage_path.startswith("gs://"):
+        return storage_path
+    return storage_path[5:].partition("/")[2]
+
+
+def signed_url_min_minutes(expiration_minutes: int) -> int:
+    """Lifetime guaranteed to remain on a URL from get_download_url."""
+    return expiration_minutes // 2
+
+
 def get_download_url(storage_path: str, expiration_minutes: int = 60) -> str:
     """
     Generate a download URL for a file.
     
-    For cloud storage: signed URL.
+    For cloud storage: signed URL, valid for at least half of
+    `expiration_minutes` (see `signed_url_min_minutes`).
     For local storage: local API path.
     """
     if storage_path.startswith("local://"):
@@ -91,24 +137,32 @@ def get_download_url(storage_path: str, expiration_minutes: int = 60) -> str:
 
     bucket = get_storage_bucket()
     if bucket is None:
-        clean_path = storage_path
-        if clean_path.startswith("gs://"):
-            parts = clean_path.split("/", 3)
-            clean_path = parts[3] if len(parts) > 3 else ""
+        clean_path = _strip_gs(storage_path)
         return f"/api/v1/documents/file/{clean_path}"
 
-    # Strip gs:// prefix if present
-    clean_path = storage_path
-    if clean_path.startswith("gs://"):
-        parts = clean_path.split("/", 3)
-        clean_path = parts[3] if len(parts) > 3 else ""
+    clean_path = _strip_gs(storage_path)
     
+    key = (clean_path, expiration_minutes)
+    now = time.monotonic()
+    with _signed_urls_lock:
+        cached = _signed_urls.get(key)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
     try:
         blob = bucket.blob(clean_path)
         url = blob.generate_signed_url(
             expiration=timedelta(minutes=expiration_minutes),
             method="GET",
         )
+        reuse_for = timedelta(minutes=expiration_minutes) / 2
+        if reuse_for.total_seconds() > 0:
+            with _signed_urls_lock:
+                _signed_urls.pop(key, None)
+                if len(_signed_urls) >= SIGNED_URL_CACHE_SIZE:
+                    # Drop the oldest entry (dicts keep insertion order)
+                    _signed_urls.pop(next(iter(_signed_urls)))
+                _signed_urls[key] = (url, now + reuse_for.total_seconds())
         return url
     except Exception as e:
         logger.warning(f"Could not generate signed URL: {e}")
@@ -133,10 +187,7 @@ def delete_from_storage(storage_path: str) -> bool:
     if bucket is None:
         return False
 
-    clean_path = storage_path
-    if clean_path.startswith("gs://"):
-        parts = clean_path.split("/", 3)
-        clean_path = parts[3] if len(parts) > 3 else ""
+    clean_path = _strip_gs(storage_path)
     
     try:
         blob = bucket.blob(clean_path)
@@ -150,48 +201,96 @@ def delete_from_storage(storage_path: str) -> bool:
     return False
 
 
-def download_from_storage(storage_path: str) -> Optional[bytes]:
+def download_to_file(storage_path: str, file_obj: BinaryIO) -> bool:
     """
-    Download file bytes from storage.
+    Stream a stored file into a writable binary file object.
+
+    Returns False if the file couldn't be found or downloaded.
     """
-    logger.info(f"download_from_storage called with: {storage_path}")
+    logger.info(f"download_to_file called with: {storage_path}")
     
     if storage_path.startswith("local://"):
         clean_path = storage_path.replace("local://", "")
         local_path = LOCAL_STORAGE_DIR / clean_path
         logger.info(f"Local path resolved to: {local_path}, exists={local_path.exists()}")
         if local_path.exists():
-            data = local_path.read_bytes()
-            logger.info(f"Read {len(data)} bytes from local storage")
-            return data
-        return None
+            with open(local_path, "rb") as src:
+                shutil.copyfileobj(src, file_obj, STORAGE_CHUNK_SIZE)
+            logger.info(f"Read {local_path.stat().st_size} bytes from local storage")
+            return True
+        return False
     
     # Also try local storage as fallback for any path
     # (file may have been uploaded locally even if path doesn't start with local://)
     local_fallback = LOCAL_STORAGE_DIR / storage_path
     if local_fallback.exists():
-        data = local_fallback.read_bytes()
-        logger.info(f"Found in local fallback: {local_fallback} ({len(data)} bytes)")
-        return data
+        with open(local_fallback, "rb") as src:
+            shutil.copyfileobj(src, file_obj, STORAGE_CHUNK_SIZE)
+        logger.info(f"Found in local fallback: {local_fallback} ({local_fallback.stat().st_size} bytes)")
+        return True
 
     bucket = get_storage_bucket()
     if bucket is None:
         logger.warning("No storage bucket available and file not found locally")
-        return None
+        return False
 
-    clean_path = storage_path
-    if clean_path.startswith("gs://"):
-        parts = clean_path.split("/", 3)
-        clean_path = parts[3] if len(parts) > 3 else ""
+    clean_path = _strip_gs(storage_path)
     
     try:
         blob = bucket.blob(clean_path)
         if not blob.exists():
             logger.warning(f"Blob not found in cloud storage: {clean_path}")
-            return None
-        data = blob.download_as_bytes()
-        logger.info(f"Downloaded {len(data)} bytes from cloud storage")
-        return data
+            return False
+        blob.chunk_size = STORAGE_CHUNK_SIZE
+        blob.download_to_file(file_obj)
+        logger.info(f"Downloaded {blob.size} bytes from cloud storage")
+        return True
     except Exception as e:
         logger.warning(f"Cloud download failed: {e}")
+        return False
+
+
+def download_from_storage(storage_path: str) -> Optional[bytes]:
+    """
+    Download file bytes from storage.
+
+    Buffers the whole file in memory; prefer download_to_file for
+    anything that can consume a stream.
+    """
+    buf = io.BytesIO()
+    if not download_to_file(storage_path, buf):
         return None
+    return buf.getvalue()
+
+
+# ===================
+# Async wrappers
+# ===================
+# firebase-admin Storage is blocking; async routes use these so the
+# transfer runs on a worker thread instead of stalling the event loop.
+
+async def upload_to_storage_async(
+    file_data: Union[bytes, BinaryIO], storage_path: str, content_type: str
+) -> str:
+    """Async variant of upload_to_storage."""
+    return await asyncio.to_thread(upload_to_storage, file_data, storage_path, content_type)
+
+
+async def get_download_url_async(storage_path: str, expiration_minutes: int = 60) -> str:
+    """Async variant of get_download_url."""
+    return await asyncio.to_thread(get_download_url, storage_path, expiration_minutes)
+
+
+async def delete_from_storage_async(storage_path: str) -> bool:
+    """Async variant of delete_from_storage."""
+    return await asyncio.to_thread(delete_from_storage, storage_path)
+
+
+async def download_to_file_async(storage_path: str, file_obj: BinaryIO) -> bool:
+    """Async variant of download_to_file."""
+    return await asyncio.to_thread(download_to_file, storage_path, file_obj)
+
+
+async def download_from_storage_async(storage_path: str) -> Optional[bytes]:
+    """Async variant of download_from_storage."""
+    return await asyncio.to_thread(download_from_storage, storage_path)
@@ -211,9 +211,9 @@ export default function HealthRecordsPage() {
               </Card>
             ) : (
               trends.map((trend: any) => (
-                <Card key={trend.record_type}>
+                <Card key={`${trend.record_type}-${trend.name}-${trend.unit}`}>
                   <CardHeader>
-                    <CardTitle className="text-lg">{trend.record_type}</CardTitle>
+                    <CardTitle className="text-lg">{trend.name || trend.record_type}</CardTitle>
                     <CardDescription>
                       {trend.data_points.length} data points
                       {trend.unit && ` • Unit: ${trend.unit}`}